@@ -0,0 +1,69 @@
+"""
+Benchmarks OCR and redaction of large and multi-page images.
+
+OCRs one tall synthetic scan in a single pass and in overlapping bands on the
+OCR thread pool (the words found must match), then extracts and redacts a
+multi-page group4 TIFF built from synthetic pages.
+
+    python -m benchmarks.bench_images --width 4960 --height 14032 --tiff-pages 8
+"""
+import argparse
+import os
+import tempfile
+
+from PIL import Image
+
+from core.extractor import extract_from_image, iter_image_words, OCR_TILE_PIXELS, OCR_WORKERS
+from core.ocr import get_ocr_backend
+from core.redactor import redact_image
+from benchmarks.common import timed
+from benchmarks.synthetic import make_image
+
+
+def ocr_scan(path: str, tile_pixels: int) -> list:
+    with Image.open(path) as image:
+        return next(iter_image_words(image, tile_pixels))[1]
+
+
+def make_tiff(path: str, pages: int, workdir: str) -> str:
+    frames = []
+    for page in range(pages):
+        page_path = make_image(os.path.join(workdir, f"page{page}.png"), seed=page)
+        with Image.open(page_path) as image:
+            frames.append(image.convert("1"))
+    frames[0].save(path, save_all=True, append_images=frames[1:], compression="group4")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--width", type=int, default=4960)
+    parser.add_argument("--height", type=int, default=14032)
+    parser.add_argument("--words", type=int, default=8000)
+    parser.add_argument("--tiff-pages", type=int, default=8)
+    args = parser.parse_args()
+    get_ocr_backend().warm()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        scan_path = make_image(os.path.join(tmp, "scan.png"), args.words, size=(args.width, args.height))
+        single_time, single = timed(ocr_scan, scan_path, args.width * args.height)
+        tiled_time, tiled = timed(ocr_scan, scan_path, OCR_TILE_PIXELS)
+        assert sorted(word[4] for word in single) == sorted(word[4] for word in tiled)
+
+        tiff_path = make_tiff(os.path.join(tmp, "fax.tif"), args.tiff_pages, tmp)
+        extract_time, pages = timed(extract_from_image, tiff_path)
+        boxes = [(page["page"], word[:4]) for page in pages for word in page["words"][::10]]
+        redact_time, _ = timed(redact_image, tiff_path, boxes, os.path.join(tmp, "redacted.tif"))
+        input_size, output_size = os.path.getsize(tiff_path), os.path.getsize(os.path.join(tmp, "redacted.tif"))
+
+    print(f"OCR workers: {OCR_WORKERS}")
+    print(f"{'stage':<36} {'time (s)':>10}")
+    print(f"{f'{args.width}x{args.height} scan, single pass':<36} {single_time:>10.3f}")
+    print(f"{f'{args.width}x{args.height} scan, tiled':<36} {tiled_time:>10.3f}")
+    print(f"{f'{len(pages)}-page TIFF, extract':<36} {extract_time:>10.3f}")
+    print(f"{f'{len(pages)}-page TIFF, redact {len(boxes)} boxes':<36} {redact_time:>10.3f}")
+    print(f"TIFF size: {input_size} bytes in, {output_size} bytes out")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Benchmarks the multi-severity mode of the classic engine.
+
+Compares one process_document_classic call per severity (each extracting and
+detecting again, as separate /process/ calls would) with a single
+process_document_classic_levels call that detects once for every level.
+
+    python -m benchmarks.bench_levels --pages 20 --severities 40 60 80 100
+"""
+import argparse
+import os
+import tempfile
+
+from benchmarks.common import disable_detection_cache, timed
+
+disable_detection_cache()
+
+from core.engine import process_document_classic, process_document_classic_levels
+from core.identifier_classic import get_nlp
+from core.security import generate_key
+from benchmarks.synthetic import make_pdf
+
+
+def separate_calls(pdf_path, severities):
+    return {severity: process_document_classic(pdf_path, severity, generate_key()) for severity in severities}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--words-per-page", type=int, default=300)
+    parser.add_argument("--severities", type=int, nargs="+", default=[40, 60, 80, 100])
+    args = parser.parse_args()
+    get_nlp()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = make_pdf(os.path.join(tmp, "levels.pdf"), args.pages, args.words_per_page)
+        single_time, _ = timed(process_document_classic, pdf_path, max(args.severities), generate_key())
+        separate_time, separate = timed(separate_calls, pdf_path, args.severities)
+        levels_time, levels = timed(process_document_classic_levels, pdf_path,
+                                    {severity: generate_key() for severity in args.severities})
+
+    for severity in args.severities:
+        assert separate[severity][1].keys() == levels[severity][1].keys()
+    print(f"{'mode':<28} {'time (s)':>10}")
+    print(f"{'one severity':<28} {single_time:>10.3f}")
+    print(f"{f'{len(args.severities)} separate calls':<28} {separate_time:>10.3f}")
+    print(f"{f'{len(args.severities)} levels, one call':<28} {levels_time:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Benchmarks encrypted metadata versions for documents with many redactions.
+
+Compares v1 (one AES-GCM payload per PII item, JSON bbox lists) with v2 (one
+compressed, encrypted blob per page) by JSON size and encrypt/decrypt time.
+
+    python -m benchmarks.bench_metadata --pages 10 100 --items-per-page 50
+"""
+import argparse
+import json
+import random
+
+from core.metadata import MetadataWriter, read_metadata
+from core.security import generate_key
+from benchmarks.common import timed
+from benchmarks.synthetic import PII_TEXTS
+
+
+def make_pages(n_pages: int, items_per_page: int, rng: random.Random):
+    pages = []
+    for _ in range(n_pages):
+        items = []
+        for _ in range(items_per_page):
+            x, y = rng.uniform(40, 500), rng.uniform(40, 760)
+            items.append(([x, y, x + rng.uniform(20, 120), y + 10], rng.choice(PII_TEXTS)))
+        pages.append(items)
+    return pages
+
+
+def encrypt(key, pages, version):
+    writer = MetadataWriter(key, version)
+    for page_num, items in enumerate(pages):
+        writer.add_page(page_num, items)
+    return json.dumps(writer.result())
+
+
+def decrypt(key, payload):
+    return list(read_metadata(key, json.loads(payload)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--items-per-page", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    key = generate_key()
+
+    print(f"{'pages':>6} {'items':>7} {'version':>7} {'size (KB)':>10} {'encrypt (s)':>12} {'decrypt (s)':>12}")
+    for n_pages in args.pages:
+        pages = make_pages(n_pages, args.items_per_page, rng)
+        for version in (1, 2):
+            encrypt_time, payload = timed(encrypt, key, pages, version)
+            decrypt_time, restored = timed(decrypt, key, payload)
+            assert [text for _, _, text in restored] == [text for items in pages for _, text in items]
+            print(f"{n_pages:>6} {n_pages * args.items_per_page:>7} {version:>7} {len(payload) / 1024:>10.1f} "
+                  f"{encrypt_time:>12.4f} {decrypt_time:>12.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmarks redact_pdf: time against number of redaction boxes per page.
+
+Compares the batched writer (one apply_redactions() per page) with the old
+behaviour of applying redactions after every single box.
+
+    python -m benchmarks.bench_redact_pdf --pages 5 --boxes 10 50 100 200
+"""
+import argparse
+import os
+import tempfile
+from typing import List, Tuple
+
+import fitz
+
+from core.redactor import redact_pdf
+from benchmarks.common import timed
+from benchmarks.synthetic import make_pdf
+
+
+def word_boxes(path: str, boxes_per_page: int) -> List[Tuple[int, fitz.Rect]]:
+    doc = fitz.open(path)
+    boxes = []
+    for page_num, page in enumerate(doc):
+        words = page.get_text("words")[:boxes_per_page]
+        boxes.extend((page_num, fitz.Rect(w[:4])) for w in words)
+    doc.close()
+    return boxes
+
+
+def redact_pdf_per_box(file_path: str, redaction_boxes: List[Tuple[int, fitz.Rect]], output_path: str):
+    """The pre-batching implementation, kept here as the baseline."""
+    doc = fitz.open(file_path)
+    for page_num, bbox in redaction_boxes:
+        page = doc[page_num]
+        page.add_redact_annot(bbox, fill=(0, 0, 0))
+        page.apply_redactions()
+    doc.save(output_path, garbage=4, clean=True)
+    doc.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--boxes", type=int, nargs="+", default=[10, 50, 100, 200, 400])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, "input.pdf")
+        out = os.path.join(tmp, "output.pdf")
+        make_pdf(src, args.pages, max(args.boxes))
+
+        print(f"{'boxes/page':>10} {'per-box (s)':>12} {'batched (s)':>12} {'speedup':>8}")
+        for n in args.boxes:
+            boxes = word_boxes(src, n)
+            old, _ = timed(redact_pdf_per_box, src, boxes, out, repeat=args.repeat)
+            new, _ = timed(redact_pdf, src, boxes, out, repeat=args.repeat)
+            print(f"{n:>10} {old:>12.4f} {new:>12.4f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
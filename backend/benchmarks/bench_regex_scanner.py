@@ -0,0 +1,114 @@
+"""
+Benchmarks the classic regex detectors on page text.
+
+Compares one finditer pass per pattern (the old _find_pii_regex) with the
+single-pass RegexScanner, for growing text sizes and pattern sets.
+
+    python -m benchmarks.bench_regex_scanner --chars 10000 100000 --repeat 5
+"""
+import argparse
+import random
+import re
+
+from core.identifier_classic import filter_by_severity, find_pii_classic, MAX_SEVERITY
+from core.patterns import PATTERN_REGISTRY, RegexScanner, compile_scanner
+from benchmarks.common import timed
+
+FILLER = "the quick brown fox jumps over the lazy dog and files the report on time".split()
+SAMPLES = [
+    "john.doe@example.com", "(555) 123-4567", "1234567890", "Transaction ID: 998877",
+    "Invoice Number: INV42", "4111 1111 1111 1111", "123-45-6789", "GB82 WEST 1234 5698 7654 32",
+    "Passport No: X1234567",
+]
+
+
+def make_text(n_chars: int, density: float, rng: random.Random) -> str:
+    parts, size = [], 0
+    while size < n_chars:
+        part = rng.choice(SAMPLES) if rng.random() < density else rng.choice(FILLER)
+        parts.append(part)
+        size += len(part) + 1
+    return " ".join(parts)
+
+
+def scan_per_pattern(text, labels):
+    """The pre-scanner implementation: one pass over the text per pattern."""
+    found = []
+    for label in labels:
+        pattern = PATTERN_REGISTRY[label]
+        for match in pattern.compiled.finditer(text):
+            span = match.span("value") if "value" in match.re.groupindex else match.span()
+            if pattern.validator is None or pattern.validator(text[span[0]:span[1]]):
+                found.append({"start": span[0], "end": span[1], "label": label})
+    return found
+
+
+def scan_at_boundaries(text, labels):
+    """
+    What RegexScanner.scan must find: one search per pattern, starting only at
+    RegexScanner.BOUNDARY, that moves past accepted matches like finditer but
+    retries one position on after a match the validator rejects.
+    """
+    found = []
+    for label in labels:
+        pattern = PATTERN_REGISTRY[label]
+        compiled = re.compile(f"{RegexScanner.BOUNDARY}(?:{pattern.regex})")
+        pos = 0
+        while (match := compiled.search(text, pos)) is not None:
+            span = match.span("value") if "value" in match.re.groupindex else match.span()
+            if pattern.validator is None or pattern.validator(text[span[0]:span[1]]):
+                found.append({"start": span[0], "end": span[1], "label": label})
+                pos = max(match.end(), match.start() + 1)
+            else:
+                pos = match.start() + 1
+    return found
+
+
+def check_against_finditer(rng: random.Random, cases: int = 2000):
+    """Compares the scanner with scan_at_boundaries on short noisy texts full of digits and separators."""
+    labels = tuple(PATTERN_REGISTRY)
+    scanner = compile_scanner(labels)
+    noise = "0123456789" * 4 + " -.()@:#ABXZaex"
+    for _ in range(cases):
+        text = " ".join(rng.choice(SAMPLES) if rng.random() < 0.3 else "".join(rng.choice(noise) for _ in range(rng.randrange(1, 30)))
+                        for _ in range(rng.randrange(1, 6)))
+        key = lambda pii: (pii["start"], pii["end"], pii["label"])
+        assert sorted(scanner.scan(text), key=key) == sorted(scan_at_boundaries(text, labels), key=key), text
+
+
+# Text where a broader pattern overlaps a card number that severity 20 must still redact.
+OVERLAPS = ["Invoice Number: 4111111111111111", "Ref 123 4111111111111111"]
+
+
+def check_overlaps():
+    """Detection runs at the highest severity and is filtered down, so overlapping labels must all be reported."""
+    for text in OVERLAPS:
+        pii = filter_by_severity(find_pii_classic(text, MAX_SEVERITY), 20)
+        assert [text[p["start"]:p["end"]] for p in pii] == ["4111111111111111"], (text, pii)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chars", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--density", type=float, default=0.05)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    labels = tuple(PATTERN_REGISTRY)
+    check_overlaps()
+    check_against_finditer(random.Random(args.seed))
+
+    print(f"{'chars':>8} {'patterns':>9} {'per-pattern (s)':>16} {'single-pass (s)':>16} {'speedup':>8}")
+    for n_chars in args.chars:
+        text = make_text(n_chars, args.density, rng)
+        for n_patterns in range(3, len(labels) + 1, 3):
+            active = labels[:n_patterns]
+            scanner = compile_scanner(active)
+            old, _ = timed(scan_per_pattern, text, active, repeat=args.repeat)
+            new, _ = timed(scanner.scan, text, repeat=args.repeat)
+            print(f"{n_chars:>8} {n_patterns:>9} {old:>16.4f} {new:>16.4f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
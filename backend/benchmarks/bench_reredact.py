@@ -0,0 +1,52 @@
+"""
+Benchmarks re-redaction of an already redacted PDF.
+
+Redacts a synthetic PDF with the classic engine, then adds to it: one box on one
+page, and everything detected at a higher severity. Both are compared with what
+they replace, processing the original again with redact_pdf's full save.
+
+    python -m benchmarks.bench_reredact --pages 500 --severity 40 --higher-severity 100
+"""
+import argparse
+import os
+import tempfile
+
+from benchmarks.common import disable_detection_cache, timed
+
+disable_detection_cache()
+
+from core.documents import Document
+from core.engine import process_document_classic, reredact_document
+from core.identifier_classic import get_nlp
+from core.security import generate_key
+from benchmarks.synthetic import make_pdf, MARGIN
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--words-per-page", type=int, default=300)
+    parser.add_argument("--severity", type=int, default=40)
+    parser.add_argument("--higher-severity", type=int, default=100)
+    args = parser.parse_args()
+    get_nlp()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = make_pdf(os.path.join(tmp, "reredact.pdf"), args.pages, args.words_per_page)
+        key = generate_key()
+        redacted, metadata = process_document_classic(pdf_path, args.severity, key)
+        redacted = Document(f"redacted_{os.path.basename(pdf_path)}", data=redacted.read())
+        box = [(args.pages // 2, [MARGIN, MARGIN, MARGIN + 100, MARGIN + 12])]
+
+        full_time, _ = timed(process_document_classic, pdf_path, args.higher_severity, generate_key())
+        box_time, _ = timed(reredact_document, redacted, key, metadata, boxes=box)
+        severity_time, _ = timed(reredact_document, redacted, key, metadata, severity=args.higher_severity)
+
+    print(f"{'mode':<40} {'time (s)':>10}")
+    print(f"{f'process again at severity {args.higher_severity}':<40} {full_time:>10.3f}")
+    print(f"{'re-redact, one box':<40} {box_time:>10.3f}")
+    print(f"{f're-redact at severity {args.higher_severity}':<40} {severity_time:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmarks mapping PII character spans to word bboxes on one page.
+
+Compares the old scan over every word per span with WordSpanIndex's
+binary search, for growing word counts and span counts.
+
+    python -m benchmarks.bench_span_mapping --words 500 2000 8000 --spans 100 500
+"""
+import argparse
+import random
+
+import fitz
+
+from core.spans import WordSpanIndex
+from benchmarks.common import timed
+
+
+def make_words(n: int):
+    words, x, y = [], 40.0, 40.0
+    for i in range(n):
+        text = f"w{i % 97}x{i}"
+        words.append((x, y, x + 6 * len(text), y + 10, text))
+        x += 6 * len(text) + 4
+        if x > 560:
+            x, y = 40.0, y + 12
+    return words
+
+
+def make_spans(index: WordSpanIndex, n: int, rng: random.Random):
+    spans = []
+    for _ in range(n):
+        i = rng.randrange(len(index.words))
+        j = min(len(index.words) - 1, i + rng.randrange(3))
+        spans.append((index.starts[i] + 1, index.ends[j] - 1))
+    return spans
+
+
+def map_linear(words, spans):
+    """The pre-index implementation from process_document_classic."""
+    char_offset, word_indices = 0, {}
+    for i, word_info in enumerate(words):
+        start, end = char_offset, char_offset + len(word_info[4])
+        word_indices[i] = {'start': start, 'end': end, 'bbox': fitz.Rect(word_info[0:4]), 'text': word_info[4]}
+        char_offset = end + 1
+    results = []
+    for pii_start, pii_end in spans:
+        bboxes, parts = [], []
+        for word_info in word_indices.values():
+            if max(pii_start, word_info['start']) < min(pii_end, word_info['end']):
+                bboxes.append(word_info['bbox'])
+                parts.append(word_info['text'])
+        if bboxes:
+            final_bbox = fitz.Rect()
+            for bbox in bboxes: final_bbox.include_rect(bbox)
+            results.append((final_bbox, " ".join(parts)))
+    return results
+
+
+def map_indexed(words, spans):
+    index = WordSpanIndex(words)
+    return [resolved for resolved in (index.resolve(start, end) for start, end in spans) if resolved]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, nargs="+", default=[500, 2000, 8000])
+    parser.add_argument("--spans", type=int, nargs="+", default=[50, 200, 800])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    print(f"{'words':>6} {'spans':>6} {'linear (s)':>11} {'indexed (s)':>12} {'speedup':>8}")
+    for n_words in args.words:
+        words = make_words(n_words)
+        index = WordSpanIndex(words)
+        for n_spans in args.spans:
+            spans = make_spans(index, n_spans, rng)
+            old, old_result = timed(map_linear, words, spans)
+            new, new_result = timed(map_indexed, words, spans)
+            assert [text for _, text in old_result] == [text for _, text in new_result]
+            print(f"{n_words:>6} {n_spans:>6} {old:>11.4f} {new:>12.4f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
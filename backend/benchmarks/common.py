@@ -0,0 +1,26 @@
+"""
+Helpers shared by the benchmark scripts. Nothing here imports core, so
+disable_detection_cache() can run before it is.
+"""
+import os
+import time
+
+
+def disable_detection_cache():
+    """
+    Detections are cached by document hash, which would make every call after the
+    first a cache hit. Must run before core is imported, as its settings are read
+    at import time.
+    """
+    os.environ["DETECTION_CACHE_MAX_ENTRIES"] = "0"
+    os.environ["DETECTION_CACHE_DIR"] = ""
+
+
+def timed(fn, *args, repeat: int = 1, **kwargs):
+    """Calls fn repeat times and returns (best time in seconds, result of the last call)."""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
@@ -0,0 +1,51 @@
+"""
+A stand-in for the Gemini model, so the LLM engine can be benchmarked without
+network access or API quota. It answers every image with the PII samples the
+synthetic documents are built from, and every text request with the word spans
+where those samples occur, after a configurable latency.
+"""
+import json
+import re
+import threading
+import time
+
+from benchmarks.synthetic import PII_SAMPLES
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+# Pages as formatted by identify_pii_in_text.
+PAGE_PATTERN = re.compile(r'<page number="(\d+)">\n(.*?)\n</page>', re.DOTALL)
+
+
+def find_spans(prompt: str) -> list:
+    spans = []
+    for page_num, numbered in PAGE_PATTERN.findall(prompt):
+        words = [token.split(":", 1)[1] for token in numbered.split(" ")]
+        for text, label in PII_SAMPLES:
+            needle = text.split()
+            for start in range(len(words) - len(needle) + 1):
+                if words[start:start + len(needle)] == needle:
+                    spans.append({"page": int(page_num), "start": start, "end": start + len(needle) - 1, "label": label})
+    return spans
+
+
+class FakeGeminiModel:
+    """Has the generate_content() used by identify_pii_text_with_vision and identify_pii_in_text; counts calls."""
+
+    def __init__(self, latency: float = 0.5):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._response = "```json\n" + json.dumps([{"text": text, "label": label} for text, label in PII_SAMPLES]) + "\n```"
+
+    def generate_content(self, parts, stream: bool = False) -> FakeResponse:
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        if len(parts) == 1:
+            return FakeResponse(json.dumps(find_spans(parts[0])))
+        return FakeResponse(self._response)
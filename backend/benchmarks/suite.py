@@ -0,0 +1,283 @@
+"""
+Benchmark and load-test suite for the redaction engines.
+
+Times each stage of the classic pipeline on a synthetic PDF (and image, when
+an OCR backend is available), then the /process/ endpoint end to end under
+concurrent load through an in-process ASGI client. The LLM engine, in vision
+and in text mode, talks to benchmarks.fake_llm instead of Gemini, so no
+network access is needed.
+
+Results are written as JSON. With --baseline, every timing is compared to an
+earlier run and the suite exits with status 1 if any is slower by more than
+--tolerance (and by more than --min-delta seconds, to ignore timer noise).
+
+    python -m benchmarks.suite --pages 20 --output baseline.json
+    python -m benchmarks.suite --pages 20 --baseline baseline.json --tolerance 0.25
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict
+
+from benchmarks.common import disable_detection_cache
+
+
+def configure_environment(args):
+    """Must run before core is imported, as its settings are read at import time."""
+    disable_detection_cache()
+    os.environ["PROCESS_WORKERS"] = str(args.workers)
+    os.environ.setdefault("LLM_REQUESTS_PER_MINUTE", "100000")
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+
+def time_stage(fn: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    return {"best": min(runs), "mean": statistics.mean(runs), "runs": runs}
+
+
+def run_stages(args, workdir: str) -> Dict[str, Any]:
+    from core.extractor import extract_from_pdf, extract_from_image
+    from core.identifier_classic import find_pii_classic_batch, get_nlp, MAX_SEVERITY
+    from core.spans import WordSpanIndex
+    from core.redactor import redact_pdf
+    from core.security import encrypt_text, generate_key
+    from core.metadata import MetadataWriter
+    from core.engine import unredact_document
+    from core.ocr import get_ocr_backend
+    from benchmarks.synthetic import make_pdf, make_image
+
+    pdf_path = make_pdf(os.path.join(workdir, "stages.pdf"), args.pages, args.words_per_page, args.pii_density, args.seed)
+    redacted_path = os.path.join(workdir, "redacted_stages.pdf")
+    key = generate_key()
+    get_nlp()
+
+    state: Dict[str, Any] = {}
+
+    def extract():
+        state["pages"] = extract_from_pdf(pdf_path)
+
+    def detect():
+        state["texts"] = [WordSpanIndex(page["words"]).text for page in state["pages"]]
+        state["pii"] = find_pii_classic_batch(state["texts"], MAX_SEVERITY)
+
+    def map_spans():
+        state["boxes"], state["items"] = [], {}
+        for page, page_pii in zip(state["pages"], state["pii"]):
+            index = WordSpanIndex(page["words"])
+            for pii in page_pii:
+                resolved = index.resolve(pii["start"], pii["end"])
+                if resolved:
+                    bbox, text = resolved
+                    state["boxes"].append((page["page"], bbox))
+                    state["items"].setdefault(page["page"], []).append((list(bbox), text))
+
+    def redact():
+        redact_pdf(pdf_path, state["boxes"], redacted_path)
+
+    def encrypt():
+        for items in state["items"].values():
+            for _, text in items:
+                encrypt_text(key, text)
+
+    def metadata(version: int):
+        writer = MetadataWriter(key, version)
+        for page_num, items in state["items"].items():
+            writer.add_page(page_num, items)
+        state[f"metadata_v{version}"] = writer.result()
+
+    def unredact(version: int):
+        unredact_document(redacted_path, key, state[f"metadata_v{version}"])
+
+    results: Dict[str, Any] = {
+        "extract_from_pdf": time_stage(extract, args.repeat),
+        "find_pii_classic": time_stage(detect, args.repeat),
+        "span_mapping": time_stage(map_spans, args.repeat),
+        "redact_pdf": time_stage(redact, args.repeat),
+        "encrypt_text": time_stage(encrypt, args.repeat),
+        "metadata_v1": time_stage(lambda: metadata(1), args.repeat),
+        "metadata_v2": time_stage(lambda: metadata(2), args.repeat),
+        "unredact_document_v1": time_stage(lambda: unredact(1), args.repeat),
+        "unredact_document_v2": time_stage(lambda: unredact(2), args.repeat),
+    }
+    results["counts"] = {
+        "pages": len(state["pages"]),
+        "words": sum(len(page["words"]) for page in state["pages"]),
+        "detections": sum(len(page_pii) for page_pii in state["pii"]),
+        "redactions": len(state["boxes"]),
+    }
+
+    try:
+        get_ocr_backend().warm()
+    except Exception as e:
+        results["extract_from_image"] = {"skipped": f"No OCR backend: {e}"}
+    else:
+        image_path = make_image(os.path.join(workdir, "stages.png"), args.words_per_page, args.pii_density, args.seed)
+        results["extract_from_image"] = time_stage(lambda: extract_from_image(image_path), args.repeat)
+    return results
+
+
+async def load_test(client, engine: str, pdf_bytes: bytes, args, llm_mode: str = "vision") -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, statuses = [], {}
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(
+                "/process/",
+                files={"file": ("load.pdf", pdf_bytes, "application/pdf")},
+                data={"severity": str(args.severity), "engine": engine, "llm_mode": llm_mode, "response_format": "multipart"},
+            )
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(args.requests)))
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "statuses": {str(code): count for code, count in statuses.items()},
+        "wall": wall,
+        "throughput_rps": args.requests / wall,
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "max": latencies[-1],
+    }
+
+
+async def run_load(args, workdir: str) -> Dict[str, Any]:
+    from httpx import ASGITransport, AsyncClient
+    import main
+    import core.identifier_llm as identifier_llm
+    from benchmarks.fake_llm import FakeGeminiModel
+    from benchmarks.synthetic import make_pdf
+
+    pdf_path = make_pdf(os.path.join(workdir, "load.pdf"), args.load_pages, args.words_per_page, args.pii_density, args.seed)
+    with open(pdf_path, "rb") as f:
+        pdf_bytes = f.read()
+
+    fake_model = FakeGeminiModel(latency=args.llm_latency)
+    identifier_llm.model = fake_model
+    results: Dict[str, Any] = {}
+    async with main.lifespan(main.app):
+        async with AsyncClient(transport=ASGITransport(app=main.app), base_url="http://benchmark", timeout=None) as client:
+            results["classic"] = await load_test(client, "classic", pdf_bytes, args)
+            for name, llm_mode in (("llm", "vision"), ("llm_text", "text")):
+                if args.workers > 0:
+                    # Worker processes import their own Gemini model, which the fake cannot replace.
+                    results[name] = {"skipped": "The fake LLM only applies with --workers 0."}
+                    continue
+                calls_before = fake_model.calls
+                results[name] = await load_test(client, "llm", pdf_bytes, args, llm_mode)
+                results[name]["model_calls"] = fake_model.calls - calls_before
+    return results
+
+
+def timings(results: Dict[str, Any]) -> Dict[str, float]:
+    """Flattens the comparable timings of a run into {"stages.redact_pdf.best": seconds, ...}."""
+    flat = {}
+    for name, stage in results.get("stages", {}).items():
+        if "best" in stage:
+            flat[f"stages.{name}.best"] = stage["best"]
+    for engine, load in results.get("load", {}).items():
+        for metric in ("p50", "p95"):
+            if metric in load:
+                flat[f"load.{engine}.{metric}"] = load[metric]
+    return flat
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, min_delta: float) -> list:
+    """Returns a line per timing that regressed beyond tolerance, and prints every comparison."""
+    regressions = []
+    if current["meta"]["params"] != baseline["meta"].get("params"):
+        print("Warning: the baseline was run with different parameters; timings may not be comparable.")
+    base_timings = timings(baseline)
+    for name, value in timings(current).items():
+        if name not in base_timings:
+            continue
+        base = base_timings[name]
+        change = (value - base) / base if base else 0.0
+        line = f"{name:<36} {base:>10.4f} -> {value:>10.4f}  ({change:+.0%})"
+        print(line)
+        if value > base * (1 + tolerance) and value - base > min_delta:
+            regressions.append(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=20, help="pages of the document timed stage by stage")
+    parser.add_argument("--words-per-page", type=int, default=300)
+    parser.add_argument("--pii-density", type=float, default=0.05, help="share of words that are PII")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--severity", type=int, default=80)
+    parser.add_argument("--load-pages", type=int, default=3, help="pages of each document sent to /process/")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=0, help="PROCESS_WORKERS for the load test")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds the fake LLM takes per page")
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown, 0.2 = 20%%")
+    parser.add_argument("--min-delta", type=float, default=0.01, help="slowdowns below this many seconds are ignored")
+    args = parser.parse_args()
+    configure_environment(args)
+
+    output_path = os.path.abspath(args.output)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    params = {name: value for name, value in vars(args).items()
+              if name not in ("output", "baseline", "tolerance", "min_delta")}
+    results: Dict[str, Any] = {"meta": {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "params": params,
+    }}
+
+    # The engine writes its outputs relative to the working directory.
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            results["stages"] = run_stages(args, workdir)
+            if not args.skip_load:
+                results["load"] = asyncio.run(run_load(args, workdir))
+        finally:
+            os.chdir(cwd)
+
+    for name, value in timings(results).items():
+        print(f"{name:<36} {value:>10.4f}")
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output_path}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance, args.min_delta)
+        if regressions:
+            print(f"{len(regressions)} timing(s) regressed by more than {args.tolerance:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Synthetic documents for the benchmarks: PDFs and images with a configurable
+number of pages, words per page and share of words that are PII.
+
+Generation is seeded, so the same arguments always produce the same document.
+"""
+import random
+from typing import List
+
+import fitz
+from PIL import Image, ImageDraw
+
+from core.redactor import find_font_path, load_font
+
+FILLER = ("the quick brown fox jumps over lazy dog report files account review payment order "
+          "service total amount balance statement period summary customer reference").split()
+PII_SAMPLES = [
+    ("John Doe", "PERSON"),
+    ("Jane Smith", "PERSON"),
+    ("john.doe@example.com", "EMAIL"),
+    ("(555) 123-4567", "PHONE"),
+    ("4111 1111 1111 1111", "CREDIT_CARD"),
+    ("123-45-6789", "SSN"),
+    ("Invoice Number: INV42", "INVOICE_NUMBER"),
+    ("London", "GPE"),
+]
+PII_TEXTS = [text for text, _ in PII_SAMPLES]
+
+FONT_SIZE = 9
+LINE_HEIGHT = 12
+MARGIN = 36
+
+
+def make_lines(words_per_page: int, pii_density: float, rng: random.Random, max_chars: int) -> List[str]:
+    """Lines of filler text where roughly pii_density of the words are replaced by PII samples."""
+    lines, line, words = [], [], 0
+    while words < words_per_page:
+        if rng.random() < pii_density:
+            token = rng.choice(PII_SAMPLES)[0]
+        else:
+            token = rng.choice(FILLER)
+        words += len(token.split())
+        if line and len(" ".join(line + [token])) > max_chars:
+            lines.append(" ".join(line))
+            line = []
+        line.append(token)
+    if line:
+        lines.append(" ".join(line))
+    return lines
+
+
+def make_pdf(path: str, pages: int = 10, words_per_page: int = 300, pii_density: float = 0.05, seed: int = 0) -> str:
+    """Writes an A4 PDF with a text layer and returns its path."""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page(width=595, height=842)
+        y = MARGIN + FONT_SIZE
+        for line in make_lines(words_per_page, pii_density, rng, max_chars=100):
+            if y > page.rect.height - MARGIN:
+                page = doc.new_page(width=595, height=842)
+                y = MARGIN + FONT_SIZE
+            page.insert_text((MARGIN, y), line, fontsize=FONT_SIZE)
+            y += LINE_HEIGHT
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def make_image(path: str, words: int = 300, pii_density: float = 0.05, seed: int = 0,
+               size: tuple = (1654, 2339)) -> str:
+    """Writes a page-sized image (A4 at 200 DPI by default) of rendered text and returns its path."""
+    rng = random.Random(seed)
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    font = load_font(find_font_path(), 28)
+    y = 100
+    for line in make_lines(words, pii_density, rng, max_chars=80):
+        if y > size[1] - 100:
+            break
+        draw.text((100, y), line, fill="black", font=font)
+        y += 40
+    image.save(path)
+    return path
@@ -0,0 +1,139 @@
+import os
+import shutil
+import uuid
+import zipfile
+import mimetypes
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional, Tuple
+
+from .workers import PROCESS_WORKERS
+
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", 1000))
+# Total uncompressed size of the files in one batch, checked before anything is
+# extracted so a small ZIP cannot expand into an unbounded amount of disk.
+BATCH_MAX_BYTES = int(os.environ.get("BATCH_MAX_BYTES", 1024 * 1024 * 1024))
+# Files of one batch processed at the same time; the rest wait their turn instead
+# of filling the process pool's queue and turning away other requests.
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", max(PROCESS_WORKERS, 1)))
+
+
+class BatchTooLargeError(ValueError):
+    """Raised when a batch has more than BATCH_MAX_FILES files or BATCH_MAX_BYTES bytes."""
+
+
+class BatchItem(NamedTuple):
+    filename: str
+    input_path: str
+    content_type: Optional[str]
+
+
+def is_zip_upload(filename: str, content_type: Optional[str]) -> bool:
+    return (filename or "").lower().endswith(".zip") or content_type in ("application/zip", "application/x-zip-compressed")
+
+
+def _zip_members(archive: zipfile.ZipFile) -> Iterator[Tuple[zipfile.ZipInfo, str]]:
+    """Yields (info, filename) for the regular files of an archive, skipping folders and OS metadata."""
+    for info in archive.infolist():
+        filename = os.path.basename(info.filename)
+        if info.is_dir() or not filename or filename.startswith(".") or info.filename.startswith("__MACOSX/"):
+            continue
+        yield info, filename
+
+
+class BatchWriter:
+    """Saves the files of a batch into upload_dir, enforcing the batch limits as it goes."""
+
+    def __init__(self, upload_dir: str, max_files: int = BATCH_MAX_FILES, max_bytes: int = BATCH_MAX_BYTES):
+        self.upload_dir = upload_dir
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.items: List[BatchItem] = []
+        self.total_bytes = 0
+
+    def _reserve(self, count: int, size: int):
+        if len(self.items) + count > self.max_files:
+            raise BatchTooLargeError(f"A batch can contain at most {self.max_files} files.")
+        if self.total_bytes + size > self.max_bytes:
+            raise BatchTooLargeError(f"A batch can contain at most {self.max_bytes} bytes.")
+        self.total_bytes += size
+
+    def add(self, filename: str, source: BinaryIO, content_type: Optional[str]) -> BatchItem:
+        input_path = os.path.join(self.upload_dir, f"{uuid.uuid4()}_{filename}")
+        with open(input_path, "wb") as buffer:
+            shutil.copyfileobj(source, buffer)
+        item = BatchItem(filename, input_path, content_type)
+        self.items.append(item)
+        return item
+
+    def add_upload(self, filename: str, source: BinaryIO, content_type: Optional[str]):
+        """Adds one uploaded file, or every file inside it if it is a ZIP archive."""
+        if not is_zip_upload(filename, content_type):
+            source.seek(0, os.SEEK_END)
+            self._reserve(1, source.tell())
+            source.seek(0)
+            self.add(filename, source, content_type)
+            return
+        try:
+            archive = zipfile.ZipFile(source)
+        except zipfile.BadZipFile:
+            raise ValueError(f"{filename} is not a valid ZIP archive.")
+        with archive:
+            members = list(_zip_members(archive))
+            self._reserve(len(members), sum(info.file_size for info, _ in members))
+            for info, member_name in members:
+                with archive.open(info) as member:
+                    self.add(member_name, member, mimetypes.guess_type(member_name)[0])
+
+    def cleanup(self):
+        for item in self.items:
+            if os.path.exists(item.input_path):
+                os.remove(item.input_path)
+
+
+class _ChunkSink:
+    """A write-only, non-seekable file object, so zipfile streams entries with data descriptors."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+class ZipStream:
+    """
+    Builds a ZIP archive incrementally: after each entry is added, drain() returns
+    the bytes written so far, so the archive can be sent while later entries are
+    still being produced. Only the entry currently being written is held in memory.
+    """
+
+    def __init__(self):
+        self._sink = _ChunkSink()
+        self._archive = zipfile.ZipFile(self._sink, mode="w", compression=zipfile.ZIP_DEFLATED)
+        self._names = set()
+
+    def unique_name(self, name: str) -> str:
+        stem, extension = os.path.splitext(name)
+        candidate, counter = name, 1
+        while candidate in self._names:
+            candidate = f"{stem}_{counter}{extension}"
+            counter += 1
+        self._names.add(candidate)
+        return candidate
+
+    def add_file(self, file_path: str, arcname: str):
+        self._archive.write(file_path, arcname)
+
+    def add_bytes(self, arcname: str, data: bytes):
+        self._archive.writestr(arcname, data)
+
+    def close(self):
+        self._archive.close()
+
+    def drain(self) -> bytes:
+        data = b"".join(self._sink.chunks)
+        self._sink.chunks.clear()
+        return data
@@ -0,0 +1,164 @@
+import os
+import json
+import hashlib
+import threading
+from base64 import urlsafe_b64decode
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from .security import encrypt_text, decrypt_text
+from .documents import Source
+from .metrics import increment
+
+DETECTION_CACHE_MAX_ENTRIES = int(os.environ.get("DETECTION_CACHE_MAX_ENTRIES", 128))
+DETECTION_CACHE_MAX_BYTES = int(os.environ.get("DETECTION_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+# Every pool worker has its own memory tier, which starts empty and is lost whenever
+# the worker is replaced after PROCESS_MAX_TASKS_PER_CHILD tasks. The disk tier is the
+# one shared by all workers and kept across restarts. It holds detected PII, so it is
+# only enabled together with a key (url-safe base64, 32 bytes) used to encrypt every
+# entry at rest.
+DETECTION_CACHE_DIR = os.environ.get("DETECTION_CACHE_DIR", "")
+DETECTION_CACHE_KEY = os.environ.get("DETECTION_CACHE_KEY", "")
+DETECTION_CACHE_DISK_MAX_BYTES = int(os.environ.get("DETECTION_CACHE_DISK_MAX_BYTES", 1024 * 1024 * 1024))
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_sha256(source: Source) -> str:
+    """file_sha256 for a path, bytes or a readable binary file (which is rewound afterwards)."""
+    if isinstance(source, str):
+        return file_sha256(source)
+    if isinstance(source, (bytes, bytearray)):
+        return hashlib.sha256(source).hexdigest()
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    source.seek(0)
+    return digest.hexdigest()
+
+
+class DetectionCache:
+    """
+    Content-addressed cache of extraction + detection results.
+    Entries are JSON-serialisable dicts keyed by (document hash, engine, model version).
+    A size-bounded LRU lives in memory; an optional encrypted disk tier is shared
+    between processes and survives restarts.
+    Hits, disk hits, misses and evictions are kept in stats and counted on the
+    detection_cache metric.
+    """
+
+    def __init__(self, max_entries: int = DETECTION_CACHE_MAX_ENTRIES, max_bytes: int = DETECTION_CACHE_MAX_BYTES,
+                 directory: str = DETECTION_CACHE_DIR, disk_key: Optional[bytes] = None,
+                 disk_max_bytes: int = DETECTION_CACHE_DISK_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        if directory and not disk_key:
+            print("Warning: DETECTION_CACHE_DIR is set without DETECTION_CACHE_KEY, the disk cache is disabled.")
+        self.directory = directory if directory and disk_key else ""
+        self.disk_key = disk_key
+        self.disk_max_bytes = disk_max_bytes
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def _count(self, event: str):
+        self.stats[event] += 1
+        increment("detection_cache", event=event)
+
+    @staticmethod
+    def key(document_hash: str, engine: str, model_version: str) -> str:
+        return hashlib.sha256(f"{document_hash}:{engine}:{model_version}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._count("hits")
+                return json.loads(self._entries[key][0])
+        payload = self._read_disk(key)
+        with self._lock:
+            if payload is None:
+                self._count("misses")
+                return None
+            self._count("disk_hits")
+            self._put_memory(key, payload)
+        return json.loads(payload)
+
+    def put(self, key: str, entry: Dict[str, Any]):
+        payload = json.dumps(entry, separators=(",", ":"))
+        with self._lock:
+            self._put_memory(key, payload)
+        self._write_disk(key, payload)
+
+    def _put_memory(self, key: str, payload: str):
+        if self.max_entries <= 0 or len(payload) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (payload, len(payload))
+        self._bytes += len(payload)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self._count("evictions")
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.bin")
+
+    def _read_disk(self, key: str) -> Optional[str]:
+        if not self.directory or not os.path.exists(self._path(key)):
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                payload = decrypt_text(self.disk_key, f.read())
+            os.utime(self._path(key))
+            return payload
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read detection cache entry {key}: {e}")
+            return None
+
+    def _write_disk(self, key: str, payload: str):
+        if not self.directory:
+            return
+        temp_path = f"{self._path(key)}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(encrypt_text(self.disk_key, payload))
+        os.replace(temp_path, self._path(key))
+        self._evict_disk()
+
+    def _evict_disk(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".bin"):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                self._count("evictions")
+            except OSError:
+                pass
+
+
+detection_cache = DetectionCache(
+    disk_key=urlsafe_b64decode(DETECTION_CACHE_KEY) if DETECTION_CACHE_KEY else None,
+)
@@ -0,0 +1,117 @@
+import os
+import uuid
+from io import BytesIO
+from typing import BinaryIO, Callable, Iterator, NamedTuple, Optional, Tuple, Union
+
+import fitz
+from PIL import Image
+
+# Documents up to this size are passed between the API, the workers and the
+# engines as bytes; larger ones are written to disk and passed by path.
+SPILL_THRESHOLD_BYTES = int(os.environ.get("SPILL_THRESHOLD_BYTES", 32 * 1024 * 1024))
+
+# Pillow warns about images over this many pixels and refuses those over twice as
+# many; its default (~89 megapixels) rejects 600 dpi scans of large pages.
+IMAGE_MAX_PIXELS = int(os.environ.get("IMAGE_MAX_PIXELS", 256_000_000))
+Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+
+# A document to read: a path, its bytes, or a readable binary file.
+Source = Union[str, bytes, BinaryIO]
+# Where to write a document: a path, or a writable binary file.
+Target = Union[str, BinaryIO]
+
+
+class Document(NamedTuple):
+    """A named document, held in memory as data or, once spilled, on disk at path."""
+    name: str
+    data: Optional[bytes] = None
+    path: Optional[str] = None
+
+    @property
+    def source(self) -> Source:
+        return self.data if self.data is not None else self.path
+
+    @property
+    def extension(self) -> str:
+        return os.path.splitext(self.name)[1].lower()
+
+    def read(self) -> bytes:
+        if self.data is not None:
+            return self.data
+        with open(self.path, "rb") as f:
+            return f.read()
+
+
+def as_document(document: Union[str, Document]) -> Document:
+    """Engines accept a Document or a path; a path is named after its basename."""
+    if isinstance(document, Document):
+        return document
+    return Document(os.path.basename(document), path=document)
+
+
+def unique_path(directory: str, name: str) -> str:
+    """A path in directory for name that no concurrent request will also pick."""
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{uuid.uuid4().hex}_{name}")
+
+
+def save_document(document: Document, directory: str) -> str:
+    """Path of the document on disk, writing it to a new file in directory if it is held in memory."""
+    if document.data is None:
+        return document.path
+    path = unique_path(directory, document.name)
+    with open(path, "wb") as f:
+        f.write(document.data)
+    return path
+
+
+def spill(document: Document, directory: str, threshold: int = SPILL_THRESHOLD_BYTES) -> Document:
+    """Moves an in-memory document larger than threshold to a file in directory."""
+    if document.data is None or len(document.data) <= threshold:
+        return document
+    return Document(document.name, path=save_document(document, directory))
+
+
+def write_document(name: str, directory: str, write: Callable[[BinaryIO], None]) -> Document:
+    """Runs write(buffer) against an in-memory buffer and returns the output, spilled to directory if large."""
+    buffer = BytesIO()
+    write(buffer)
+    with buffer.getbuffer() as view:
+        if view.nbytes <= SPILL_THRESHOLD_BYTES:
+            return Document(name, data=bytes(view))
+        # Written straight from the buffer, without copying a large output to bytes first.
+        path = unique_path(directory, name)
+        with open(path, "wb") as f:
+            f.write(view)
+    return Document(name, path=path)
+
+
+def open_pdf(source: Source) -> fitz.Document:
+    if isinstance(source, str):
+        return fitz.open(source)
+    if not isinstance(source, (bytes, bytearray)):
+        source = source.read()
+    return fitz.open(stream=source, filetype="pdf")
+
+
+def open_image(source: Source) -> Image.Image:
+    return Image.open(BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+
+
+def iter_frames(image: Image.Image) -> Iterator[Tuple[int, Image.Image]]:
+    """
+    Yields (page_num, frame) for each page of an open image: every frame of a TIFF,
+    otherwise just the image. Frames are the image itself, seeked, so each is only
+    valid until the next is yielded.
+    """
+    if image.format != "TIFF":
+        yield 0, image
+        return
+    for page_num in range(getattr(image, "n_frames", 1)):
+        image.seek(page_num)
+        yield page_num, image
+
+
+def save_image(image: Image.Image, target: Target, image_format: Optional[str], **options):
+    """Saves to a path, in the format of its extension, or to a file object in image_format."""
+    image.save(target, format=None if isinstance(target, str) else image_format, **options)
@@ -1,172 +1,499 @@
 import os
-import shutil
-import fitz  
-import time
-from typing import Dict, Any, Tuple
+from collections import defaultdict
+from functools import partial
+from itertools import accumulate, chain
+from typing import Dict, Any, Iterator, List, Tuple, Callable, Optional, Union
 
-from .security import decrypt_text, encrypt_text
-from .redactor import redact_pdf, redact_image, write_on_image, write_on_pdf
-from .extractor import extract_from_pdf, extract_from_image
+import fitz
 
-from .identifier_llm import find_pii as find_pii_llm
-from .identifier_classic import find_pii_classic
+from .documents import Document, Source, as_document, open_pdf, write_document
+from .metadata import METADATA_VERSION, MetadataWriter, check_metadata_key, merge_metadata, read_metadata
+from .metrics import count_detections, count_pages, instrumented, stage, timed_iter
+from .redactor import redact_pdf, redact_page, redact_image, save_redacted_pdf, save_reredacted_pdf, write_on_image, write_on_pdf, \
+    group_boxes_by_page
+from .extractor import extract_from_pdf, extract_from_image, iter_pdf_words, render_pdf_pages, render_image_pages, \
+    pages_without_text_layer, EXTRACTOR_VERSION
 
-API_CALL_DELAY_SECONDS = 5
+from .cache import DetectionCache, detection_cache, source_sha256
+from .identifier_llm import find_pii as find_pii_llm, find_pii_any as find_pii_any_llm, pack_pages, \
+    filter_by_severity as filter_by_severity_llm, normalize_label, model_version as llm_model_version, LLM_MODE, LLM_MODES, \
+    MAX_SEVERITY as LLM_MAX_SEVERITY, SEVERITY_MAPPING as LLM_SEVERITY_MAPPING, KNOWN_LABELS as LLM_KNOWN_LABELS
+from .identifier_classic import find_pii_classic_batch, iter_pii_classic, default_n_process, \
+    filter_by_severity as filter_by_severity_classic, \
+    model_version as classic_model_version, MAX_SEVERITY as CLASSIC_MAX_SEVERITY, SEVERITY_MAPPING as CLASSIC_SEVERITY_MAPPING
+from .llm_scheduler import LLMPageScheduler
+from .spans import WordSpanIndex, TokenIndex
 
-def process_document_llm(file_path: str, severity: int, encryption_key: bytes) -> Tuple[str, Dict[str, Any]]:
-    file_extension = os.path.splitext(file_path)[1].lower()
-    
+IMAGE_EXTENSIONS = [".png", ".jpg", ".jpeg", ".tif", ".tiff"]
+SUPPORTED_EXTENSIONS = [".pdf"] + IMAGE_EXTENSIONS
+# A cached classic detection holds every word of every page, so longer PDFs are
+# streamed through without being cached to keep memory independent of page count.
+CLASSIC_CACHE_MAX_PAGES = int(os.environ.get("CLASSIC_CACHE_MAX_PAGES", 200))
+# Outputs are returned in memory; only those past SPILL_THRESHOLD_BYTES are written here.
+REDACTED_DIR = "redacted_files"
+RESTORED_DIR = "restored_files"
+
+# progress(stage, pages_done, pages_total), used by the job API to report status.
+ProgressCallback = Optional[Callable[[str, int, int], None]]
+
+def _report(progress: ProgressCallback, stage: str, pages_done: int, pages_total: int):
+    if progress is not None:
+        progress(stage, pages_done, pages_total)
+
+def _extract_pages(source: Source, file_extension: str):
     if file_extension == ".pdf":
-        ocr_pages_data = extract_from_pdf(file_path)
-    elif file_extension in [".png", ".jpg", ".jpeg", "tiff"]:
-        ocr_pages_data = extract_from_image(file_path)
+        return extract_from_pdf(source)
+    elif file_extension in IMAGE_EXTENSIONS:
+        return extract_from_image(source)
+    raise ValueError(f"Unsupported file type: {file_extension}")
+
+def _text_mode_requests(document: Document, pages_data: List[Dict[str, Any]]) -> Tuple[Iterator[Any], List[List[int]]]:
+    """
+    LLM requests for text mode, with the page numbers each one covers: the words of
+    pages with a usable text layer, packed several pages per request, then an image
+    of every page without one. Images are rendered lazily, as the scheduler asks for them.
+    """
+    if document.extension == ".pdf":
+        vision_pages = pages_without_text_layer(document.source)
+        page_images = render_pdf_pages(document.source, pages=vision_pages)
     else:
-        raise ValueError(f"Unsupported file type: {file_extension}")
+        vision_pages = {page_data["page"] for page_data in pages_data}
+        page_images = render_image_pages(document.source, pages=vision_pages)
+    images = (image for _, image in timed_iter("render", page_images))
+    text_pages = [
+        (page_data["page"], [word_info[4] for word_info in page_data["words"]])
+        for page_data in pages_data
+        if page_data["page"] not in vision_pages and page_data["words"]
+    ]
+    batches = list(pack_pages(text_pages))
+    request_pages = [[page_num for page_num, _ in batch] for batch in batches] + [[page_num] for page_num in sorted(vision_pages)]
+    return chain(batches, images), request_pages
 
-    page_images = []
-    temp_image_dir = "temp_page_images"
-    os.makedirs(temp_image_dir, exist_ok=True)
-    if file_extension == ".pdf":
-        doc = fitz.open(file_path)
-        for i, page in enumerate(doc):
-            pix = page.get_pixmap(dpi=200)
-            image_path = os.path.join(temp_image_dir, f"page_{i}.png")
-            pix.save(image_path)
-            page_images.append((i, image_path))
-        doc.close()
+def detect_document_llm(document: Union[str, Document], progress: ProgressCallback = None, scheduler: Optional[LLMPageScheduler] = None,
+                        cache: Optional[DetectionCache] = None, mode: str = LLM_MODE) -> Dict[str, Any]:
+    """
+    Extracts words and asks the LLM for PII of every label on every page.
+    Returns {"pages": [{"page", "words", "pii"}]}; results are cached by document hash,
+    so filtering to a severity is left to the caller. A custom scheduler must
+    therefore request LLM_MAX_SEVERITY. Documents where a page request failed are not cached.
+    In "text" mode, requests are lists of (page_num, words) as well as images (see
+    find_pii_any), and detections carry word_start/word_end spans where the model gave them.
+    """
+    if mode not in LLM_MODES:
+        raise ValueError(f"Unsupported LLM mode: {mode}")
+    document = as_document(document)
+    file_extension = document.extension
+    cache = cache or detection_cache
+    with stage("cache"):
+        cache_key = cache.key(source_sha256(document.source), "llm", f"{llm_model_version(mode)}-{EXTRACTOR_VERSION}")
+        entry = cache.get(cache_key)
+    if entry is not None:
+        return entry
+
+    _report(progress, "extracting", 0, 0)
+    with stage("extract"):
+        ocr_pages_data = _extract_pages(document.source, file_extension)
+    page_count = len(ocr_pages_data)
+
+    if mode == "text":
+        requests, request_pages = _text_mode_requests(document, ocr_pages_data)
+        find = find_pii_any_llm
     else:
-        page_images.append((0, file_path))
-
-    redaction_visuals = []
-    encrypted_metadata = {"pages": {}}
-
-    for i, (page_num, image_path) in enumerate(page_images):
-        print(f"Processing page {page_num+1}/{len(page_images)} with LLM...")
-        ocr_words_on_page = ocr_pages_data[page_num]["words"]
-        pii_text_list = find_pii_llm(image_path, severity)
-        
-        if not pii_text_list: continue
-        encrypted_metadata["pages"][str(page_num)] = []
-
-        for pii in pii_text_list:
-            pii_plaintext = pii.get("text")
-            if not pii_plaintext: continue
-            pii_words = pii_plaintext.split()
-            found_bboxes = []
-            for i in range(len(ocr_words_on_page) - len(pii_words) + 1):
-                is_match = all(ocr_words_on_page[i+j][4] == pii_words[j] for j in range(len(pii_words)))
-                if is_match:
-                    found_bboxes = [fitz.Rect(ocr_words_on_page[i+j][:4]) for j in range(len(pii_words))]
-                    break
-            if found_bboxes:
-                final_bbox = fitz.Rect()
-                for bbox in found_bboxes: final_bbox.include_rect(bbox)
-                encrypted_text = encrypt_text(encryption_key, pii_plaintext)
-                encrypted_metadata["pages"][str(page_num)].append({
-                    "encrypted_text": encrypted_text.decode('utf-8'),
-                    "bbox": [final_bbox.x0, final_bbox.y0, final_bbox.x1, final_bbox.y1]
-                })
-                redaction_visuals.append((page_num, final_bbox) if file_extension == ".pdf" else final_bbox)
-        
-        if i < len(page_images) - 1:
-            print(f"Waiting for {API_CALL_DELAY_SECONDS} seconds...")
-            time.sleep(API_CALL_DELAY_SECONDS)
-
-    if os.path.exists(temp_image_dir): shutil.rmtree(temp_image_dir)
-    
-    if not redaction_visuals: return file_path, {}
-    output_dir, base_filename = "redacted_files", os.path.basename(file_path)
-    os.makedirs(output_dir, exist_ok=True)
-    output_path = os.path.join(output_dir, f"redacted_llm_{base_filename}")
-    if file_extension == ".pdf": redact_pdf(file_path, redaction_visuals, output_path)
-    else: redact_image(file_path, redaction_visuals, output_path)
-    return output_path, encrypted_metadata
-
-def process_document_classic(file_path: str, severity: int, encryption_key: bytes) -> Tuple[str, Dict[str, Any]]:
-    file_extension = os.path.splitext(file_path)[1].lower()
-    
+        if file_extension == ".pdf":
+            page_images = render_pdf_pages(document.source)
+        else:
+            page_images = render_image_pages(document.source)
+        requests = (image for _, image in timed_iter("render", page_images))
+        request_pages = [[page_data["page"]] for page_data in ocr_pages_data]
+        find = find_pii_llm
+
+    if scheduler is None:
+        scheduler = LLMPageScheduler(partial(find, severity=LLM_MAX_SEVERITY, raise_errors=True), fallback=None)
+    # Requests finish out of order, so progress assumes the earliest ones finished first.
+    pages_done = list(accumulate(len(pages) for pages in request_pages))
+    _report(progress, "detecting", 0, page_count)
+    with stage("llm"):
+        pii_results = scheduler.run(
+            requests,
+            on_done=lambda done: _report(progress, "detecting", pages_done[done - 1] if done <= len(pages_done) else page_count, page_count),
+        )
+
+    # A text request answers for several pages at once; a failed request (None) fails all of them.
+    pii_by_page: Dict[int, Optional[list]] = {}
+    for pages, pii_result in zip(request_pages, pii_results):
+        for page_num in pages:
+            pii_by_page[page_num] = pii_result.get(page_num, []) if isinstance(pii_result, dict) else pii_result
+
+    entry = {"pages": [
+        {"page": page_data["page"], "words": page_data["words"], "pii": pii_by_page.get(page_data["page"]) or []}
+        for page_data in ocr_pages_data
+    ]}
+    if all(pii_text_list is not None for pii_text_list in pii_by_page.values()):
+        cache.put(cache_key, entry)
+    return entry
+
+def _llm_redactions(detections: Dict[str, Any], severity: int) -> Iterator[Tuple[int, List[fitz.Rect], List[Tuple[List[float], str]]]]:
+    """Matches the detections at the given severity on every page, yielding (page_num, bboxes, metadata items)."""
+    # Match every PII string on every page: Gemini often reports a value once even
+    # when it repeats on the same page or on later pages.
+    pii_texts = list(dict.fromkeys(
+        pii["text"]
+        for page_data in detections["pages"]
+        for pii in filter_by_severity_llm(page_data["pii"], severity)
+        if pii.get("text")
+    ))
+
+    for page_data in detections["pages"]:
+        page_num = page_data["page"]
+        with stage("match"):
+            token_index = TokenIndex(page_data["words"])
+            matched = set()
+            bboxes, items = [], []
+
+            # Word spans from text mode map straight onto the page's words.
+            spans = [
+                range(pii["word_start"], pii["word_end"])
+                for pii in filter_by_severity_llm(page_data["pii"], severity)
+                if "word_start" in pii
+            ]
+            found = (occurrence for pii_plaintext in pii_texts for occurrence in token_index.find_all(pii_plaintext))
+            for occurrence in chain(spans, found):
+                if (occurrence.start, occurrence.stop) in matched: continue
+                matched.add((occurrence.start, occurrence.stop))
+                final_bbox, page_text = token_index.resolve(occurrence)
+                items.append(([final_bbox.x0, final_bbox.y0, final_bbox.x1, final_bbox.y1], page_text))
+                bboxes.append(final_bbox)
+        yield page_num, bboxes, items
+
+@instrumented("llm", "process")
+def process_document_llm_levels(document: Union[str, Document], encryption_keys: Dict[int, bytes], progress: ProgressCallback = None,
+                                scheduler: Optional[LLMPageScheduler] = None, metadata_version: int = METADATA_VERSION,
+                                mode: str = LLM_MODE) -> Dict[int, Tuple[Document, Dict[str, Any]]]:
+    """
+    Redacts a document at several severities from a single extraction and detection pass.
+    encryption_keys maps each severity to the key for its metadata. Returns
+    {severity: (redacted Document, encrypted metadata)}; a redacted Document is in
+    memory unless larger than SPILL_THRESHOLD_BYTES, and a severity with nothing
+    to redact gets the input document back with empty metadata. mode is "vision" or "text",
+    as for detect_document_llm.
+    """
+    document = as_document(document)
+    file_extension = document.extension
+    if file_extension not in SUPPORTED_EXTENSIONS:
+        raise ValueError(f"Unsupported file type: {file_extension}")
+    results = {severity: (document, {}) for severity in encryption_keys}
+    levels = [severity for severity in encryption_keys if LLM_SEVERITY_MAPPING.get(severity)]
+    if not levels:
+        return results
+
+    detections = detect_document_llm(document, progress, scheduler, mode=mode)
+    page_count = len(detections["pages"])
+    count_pages(page_count, sum(len(page_data["words"]) for page_data in detections["pages"]))
+    # At the highest severity the model makes up its own categories; counting them as
+    # OTHER keeps the metric's label values bounded.
+    labels = (normalize_label(pii.get("label"))
+              for page_data in detections["pages"]
+              for pii in filter_by_severity_llm(page_data["pii"], max(levels))
+              if pii.get("text"))
+    count_detections(label if label in LLM_KNOWN_LABELS else "OTHER" for label in labels)
+
+    _report(progress, "redacting", page_count, page_count)
+    redact = redact_pdf if file_extension == ".pdf" else redact_image
+    for severity in levels:
+        metadata = MetadataWriter(encryption_keys[severity], metadata_version)
+        redaction_visuals = []
+        for page_num, bboxes, items in _llm_redactions(detections, severity):
+            with stage("encrypt"):
+                metadata.add_page(page_num, items)
+            redaction_visuals.extend((page_num, bbox) for bbox in bboxes)
+        if not redaction_visuals: continue
+        with stage("redact"):
+            output = write_document(f"redacted_llm_{document.name}", REDACTED_DIR, partial(redact, document.source, redaction_visuals))
+        results[severity] = (output, metadata.result())
+    return results
+
+def process_document_llm(document: Union[str, Document], severity: int, encryption_key: bytes, progress: ProgressCallback = None,
+                         scheduler: Optional[LLMPageScheduler] = None, metadata_version: int = METADATA_VERSION,
+                         mode: str = LLM_MODE) -> Tuple[Document, Dict[str, Any]]:
+    """process_document_llm_levels for a single severity: returns (redacted Document, encrypted metadata)."""
+    return process_document_llm_levels(document, {severity: encryption_key}, progress, scheduler, metadata_version, mode)[severity]
+
+def _classic_cache_key(document: Document, cache: DetectionCache) -> str:
+    with stage("cache"):
+        return cache.key(source_sha256(document.source), "classic", f"{classic_model_version()}-{EXTRACTOR_VERSION}")
+
+def iter_detections_classic(doc: fitz.Document, cache_key: str, cache: Optional[DetectionCache] = None,
+                            severity: int = CLASSIC_MAX_SEVERITY) -> Iterator[Dict[str, Any]]:
+    """
+    Yields {"page", "words", "pii"} for every page of an open PDF, one page at a time:
+    each page is extracted and run through the detectors before the caller sees it,
+    and only a bounded window of pages is held in between. PDFs up to
+    CLASSIC_CACHE_MAX_PAGES pages are run through every detector and cached once fully
+    consumed; longer ones are never cached, so they only get the detectors for
+    severity (the highest one the caller needs), which skips NER for regex-only levels.
+    """
+    cache = cache or detection_cache
+    with stage("cache"):
+        entry = cache.get(cache_key)
+    if entry is not None:
+        yield from entry["pages"]
+        return
+
+    page_count = doc.page_count
+    cached_pages: Optional[List[Dict[str, Any]]] = [] if page_count <= CLASSIC_CACHE_MAX_PAGES else None
+    pages = ((WordSpanIndex(words).text, (page_num, words)) for page_num, words in timed_iter("extract", iter_pdf_words(doc)))
+    detect_severity = CLASSIC_MAX_SEVERITY if cached_pages is not None else severity
+    detections = iter_pii_classic(pages, detect_severity, default_n_process(page_count))
+    for pii, (page_num, words) in timed_iter("detect", detections):
+        page_data = {"page": page_num, "words": words, "pii": pii}
+        if cached_pages is not None:
+            cached_pages.append(page_data)
+        yield page_data
+    if cached_pages is not None:
+        cache.put(cache_key, {"pages": cached_pages})
+
+def detect_document_classic(document: Union[str, Document], progress: ProgressCallback = None,
+                            cache: Optional[DetectionCache] = None) -> Dict[str, Any]:
+    """
+    Extracts words and runs every regex and NER detector on every page.
+    Returns {"pages": [{"page", "words", "pii"}]}; results are cached by document hash,
+    so filtering to a severity is left to the caller.
+    """
+    document = as_document(document)
+    file_extension = document.extension
+    cache = cache or detection_cache
+    cache_key = _classic_cache_key(document, cache)
+
     if file_extension == ".pdf":
-        pages_data = extract_from_pdf(file_path)
-    elif file_extension in [".png", ".jpg", ".jpeg", "tiff"]:
-        pages_data = extract_from_image(file_path)
-    else:
+        doc = open_pdf(document.source)
+        try:
+            _report(progress, "detecting", 0, doc.page_count)
+            return {"pages": list(iter_detections_classic(doc, cache_key, cache))}
+        finally:
+            doc.close()
+
+    with stage("cache"):
+        entry = cache.get(cache_key)
+    if entry is not None:
+        return entry
+
+    _report(progress, "extracting", 0, 0)
+    with stage("extract"):
+        pages_data = _extract_pages(document.source, file_extension)
+
+    _report(progress, "detecting", 0, len(pages_data))
+    with stage("detect"):
+        page_texts = [WordSpanIndex(page_data["words"]).text for page_data in pages_data]
+        page_pii = find_pii_classic_batch(page_texts, CLASSIC_MAX_SEVERITY)
+    entry = {"pages": [
+        {"page": page_data["page"], "words": page_data["words"], "pii": pii}
+        for page_data, pii in zip(pages_data, page_pii)
+    ]}
+    cache.put(cache_key, entry)
+    return entry
+
+def _classic_page_redactions(page_data: Dict[str, Any], severity: int) -> Tuple[List[fitz.Rect], List[Tuple[List[float], str]]]:
+    """Resolves a page's detections at the given severity to bboxes and (bbox, plaintext) metadata items."""
+    bboxes, items = [], []
+    pii_locations = filter_by_severity_classic(page_data["pii"], severity)
+    if not pii_locations:
+        return bboxes, items
+
+    span_index = WordSpanIndex(page_data["words"])
+    # Patterns of different labels can match the same text, e.g. a 10-digit number as PHONE and PNR.
+    spans = dict.fromkeys((pii['start'], pii['end']) for pii in pii_locations)
+    for start, end in spans:
+        resolved = span_index.resolve(start, end)
+        if resolved:
+            final_bbox, pii_plaintext = resolved
+            items.append(([final_bbox.x0, final_bbox.y0, final_bbox.x1, final_bbox.y1], pii_plaintext))
+            bboxes.append(final_bbox)
+    return bboxes, items
+
+def _count_classic_page(page_data: Dict[str, Any], severity: int):
+    count_pages(1, len(page_data["words"]))
+    count_detections(pii["label"] for pii in filter_by_severity_classic(page_data["pii"], severity))
+
+def _process_pdf_classic(document: Document, writers: Dict[int, MetadataWriter], progress: ProgressCallback) -> Dict[int, Tuple[Document, Dict[str, Any]]]:
+    """
+    Runs extract -> detect -> redact one page at a time, so peak memory does not grow
+    with the page count and progress is reported per page. Each severity redacts its
+    own open copy of the document; pages are extracted from the first.
+    """
+    docs = {}
+    try:
+        for severity in writers:
+            docs[severity] = open_pdf(document.source)
+        doc = next(iter(docs.values()))
+        page_count = doc.page_count
+        cache_key = _classic_cache_key(document, detection_cache)
+        _report(progress, "detecting", 0, page_count)
+        for pages_done, page_data in enumerate(iter_detections_classic(doc, cache_key, severity=max(writers)), 1):
+            page_num = page_data["page"]
+            _count_classic_page(page_data, max(writers))
+            for severity, metadata in writers.items():
+                with stage("map"):
+                    bboxes, items = _classic_page_redactions(page_data, severity)
+                if items:
+                    with stage("encrypt"):
+                        metadata.add_page(page_num, items)
+                    with stage("redact"):
+                        redact_page(docs[severity][page_num], bboxes)
+            _report(progress, "detecting", pages_done, page_count)
+
+        _report(progress, "redacting", page_count, page_count)
+        results = {}
+        for severity, metadata in writers.items():
+            if not metadata.pages:
+                results[severity] = (document, {})
+                continue
+            with stage("save"):
+                output = write_document(f"redacted_classic_{document.name}", REDACTED_DIR, partial(save_redacted_pdf, docs[severity]))
+            results[severity] = (output, metadata.result())
+    finally:
+        for doc in docs.values():
+            doc.close()
+    return results
+
+@instrumented("classic", "process")
+def process_document_classic_levels(document: Union[str, Document], encryption_keys: Dict[int, bytes], progress: ProgressCallback = None,
+                                    metadata_version: int = METADATA_VERSION) -> Dict[int, Tuple[Document, Dict[str, Any]]]:
+    """Like process_document_llm_levels, with the regex and NER detectors."""
+    document = as_document(document)
+    file_extension = document.extension
+    if file_extension not in SUPPORTED_EXTENSIONS:
         raise ValueError(f"Unsupported file type: {file_extension}")
+    results = {severity: (document, {}) for severity in encryption_keys}
+    writers = {
+        severity: MetadataWriter(key, metadata_version)
+        for severity, key in encryption_keys.items()
+        if CLASSIC_SEVERITY_MAPPING.get(severity)
+    }
+    if not writers:
+        return results
 
-    redaction_visuals = []
-    encrypted_metadata = {"pages": {}}
+    if file_extension == ".pdf":
+        results.update(_process_pdf_classic(document, writers, progress))
+        return results
 
+    detections = detect_document_classic(document, progress)
+    pages_data = detections["pages"]
     for page_data in pages_data:
-        page_num = page_data["page"]
-        words = page_data["words"]
-        full_text = " ".join([word[4] for word in words])
-        
-        pii_locations = find_pii_classic(full_text, severity)
-        if not pii_locations: continue
-        encrypted_metadata["pages"][str(page_num)] = []
-
-        char_offset, word_indices = 0, {}
-        for i, word_info in enumerate(words):
-            start, end = char_offset, char_offset + len(word_info[4])
-            word_indices[i] = {'start': start, 'end': end, 'bbox': fitz.Rect(word_info[0:4]), 'text': word_info[4]}
-            char_offset = end + 1
-
-        for pii in pii_locations:
-            pii_start, pii_end = pii['start'], pii['end']
-            pii_words_bboxes, pii_plaintext_parts = [], []
-            for i, word_info in word_indices.items():
-                if max(pii_start, word_info['start']) < min(pii_end, word_info['end']):
-                    pii_words_bboxes.append(word_info['bbox'])
-                    pii_plaintext_parts.append(word_info['text'])
-            if pii_words_bboxes:
-                final_bbox = fitz.Rect()
-                for bbox in pii_words_bboxes: final_bbox.include_rect(bbox)
-                pii_plaintext = " ".join(pii_plaintext_parts)
-                encrypted_text = encrypt_text(encryption_key, pii_plaintext)
-                encrypted_metadata["pages"][str(page_num)].append({
-                    "encrypted_text": encrypted_text.decode('utf-8'),
-                    "bbox": [final_bbox.x0, final_bbox.y0, final_bbox.x1, final_bbox.y1]
-                })
-                redaction_visuals.append((page_num, final_bbox) if file_extension == ".pdf" else final_bbox)
-
-    if not redaction_visuals: return file_path, {}
-    output_dir, base_filename = "redacted_files", os.path.basename(file_path)
-    os.makedirs(output_dir, exist_ok=True)
-    output_path = os.path.join(output_dir, f"redacted_classic_{base_filename}")
-    if file_extension == ".pdf": redact_pdf(file_path, redaction_visuals, output_path)
-    else: redact_image(file_path, redaction_visuals, output_path)
-    return output_path, encrypted_metadata
-
-def unredact_document(redacted_file_path: str, encryption_key: bytes, encrypted_metadata: Dict[str, Any], password: str = None) -> str:
-    file_extension = os.path.splitext(redacted_file_path)[1].lower()
+        _count_classic_page(page_data, max(writers))
+
+    _report(progress, "redacting", len(pages_data), len(pages_data))
+    for severity, metadata in writers.items():
+        redaction_visuals = []
+        for page_data in pages_data:
+            with stage("map"):
+                bboxes, items = _classic_page_redactions(page_data, severity)
+            with stage("encrypt"):
+                metadata.add_page(page_data["page"], items)
+            redaction_visuals.extend((page_data["page"], bbox) for bbox in bboxes)
+
+        if not redaction_visuals: continue
+        with stage("redact"):
+            output = write_document(f"redacted_classic_{document.name}", REDACTED_DIR, partial(redact_image, document.source, redaction_visuals))
+        results[severity] = (output, metadata.result())
+    return results
+
+def process_document_classic(document: Union[str, Document], severity: int, encryption_key: bytes, progress: ProgressCallback = None,
+                             metadata_version: int = METADATA_VERSION) -> Tuple[Document, Dict[str, Any]]:
+    """process_document_classic_levels for a single severity: returns (redacted Document, encrypted metadata)."""
+    return process_document_classic_levels(document, {severity: encryption_key}, progress, metadata_version)[severity]
+
+@instrumented("none", "unredact")
+def unredact_document(document: Union[str, Document], encryption_key: bytes, encrypted_metadata: Dict[str, Any], password: str = None) -> Document:
+    """Restores a redacted Document or path; the restored Document is in memory unless large."""
+    document = as_document(document)
+    file_extension = document.extension
     
     restored_data_for_writer = []
-    
-    for page_num, pii_items in encrypted_metadata.get("pages", {}).items():
-        for item in pii_items:
-            try:
-                decrypted_text = decrypt_text(encryption_key, item["encrypted_text"].encode('utf-8'))
-                bbox = item["bbox"]
-                if file_extension == ".pdf":
-                    restored_data_for_writer.append((int(page_num), bbox, decrypted_text))
-                else:
-                    restored_data_for_writer.append((bbox, decrypted_text))
-            except ValueError:
-                print(f"Warning: Could not decrypt an item on page {page_num}.")
-                continue
+    for page_num, bbox, decrypted_text in timed_iter("decrypt", read_metadata(encryption_key, encrypted_metadata)):
+        restored_data_for_writer.append((page_num, bbox, decrypted_text))
     
     if not restored_data_for_writer:
         raise ValueError("No data could be decrypted or restored.")
 
-    output_dir = "restored_files"
-    os.makedirs(output_dir, exist_ok=True)
-    base_filename = os.path.basename(redacted_file_path).replace("redacted_", "")
-    output_path = os.path.join(output_dir, f"restored_{base_filename}")
-    
     if file_extension == ".pdf":
-        write_on_pdf(redacted_file_path, restored_data_for_writer, output_path, password)
-    elif file_extension in [".png", ".jpg", ".jpeg", ".tiff"]:
-        write_on_image(redacted_file_path, restored_data_for_writer, output_path)
+        write = partial(write_on_pdf, document.source, restored_data_for_writer, password=password)
+    elif file_extension in IMAGE_EXTENSIONS:
+        write = partial(write_on_image, document.source, restored_data_for_writer)
     else:
         raise ValueError(f"Unsupported file type for un-redaction: {file_extension}")
-        
-    return output_path
\ No newline at end of file
+
+    output_name = f"restored_{document.name.replace('redacted_', '')}"
+    with stage("write"):
+        return write_document(output_name, RESTORED_DIR, write)
+
+def _detect_new_redactions(document: Document, doc: fitz.Document, severity: int, engine: str,
+                           mode: str) -> Iterator[Tuple[int, List[fitz.Rect], List[Tuple[List[float], str]]]]:
+    """
+    Yields (page_num, bboxes, metadata items) for the PII the engine finds at severity
+    in a redacted PDF. Text already redacted is gone from the document, so only
+    PII that is still visible is found.
+    """
+    if engine == "llm":
+        if LLM_SEVERITY_MAPPING.get(severity):
+            yield from _llm_redactions(detect_document_llm(document, mode=mode), severity)
+        return
+    if not CLASSIC_SEVERITY_MAPPING.get(severity):
+        return
+    for page_data in iter_detections_classic(doc, _classic_cache_key(document, detection_cache), severity=severity):
+        with stage("map"):
+            bboxes, items = _classic_page_redactions(page_data, severity)
+        yield page_data["page"], bboxes, items
+
+@instrumented("none", "reredact")
+def reredact_document(document: Union[str, Document], encryption_key: bytes, encrypted_metadata: Dict[str, Any],
+                      boxes: Optional[List[Tuple[int, List[float]]]] = None, severity: Optional[int] = None,
+                      engine: str = "classic", mode: str = LLM_MODE) -> Tuple[Document, Dict[str, Any]]:
+    """
+    Adds redactions to a PDF that is already redacted, given the key and metadata it
+    was redacted with: boxes, as (page_num, bbox) in PDF points, and whatever the engine
+    detects at severity in the text that is still visible. Only pages with new
+    redactions are redacted again, and the document is saved with save_reredacted_pdf.
+    The words under each new box are merged into the metadata, which keeps its version
+    and key. Returns (redacted Document, encrypted metadata); when there is nothing new
+    to redact, the input comes back unchanged.
+    """
+    document = as_document(document)
+    if document.extension != ".pdf":
+        raise ValueError(f"Only PDFs can be re-redacted, not {document.extension} files.")
+    if engine not in ("classic", "llm"):
+        raise ValueError(f"Unsupported engine: {engine}")
+    check_metadata_key(encryption_key, encrypted_metadata)
+
+    new_boxes: Dict[int, List[fitz.Rect]] = defaultdict(list)
+    new_items: Dict[int, List[Tuple[List[float], str]]] = defaultdict(list)
+    doc = open_pdf(document.source)
+    try:
+        if severity is not None:
+            for page_num, bboxes, items in _detect_new_redactions(document, doc, severity, engine, mode):
+                if bboxes:
+                    new_boxes[page_num].extend(bboxes)
+                    new_items[page_num].extend(items)
+
+        for page_num, bboxes in group_boxes_by_page(boxes or []).items():
+            if not 0 <= page_num < doc.page_count:
+                raise ValueError(f"Page {page_num} is out of range, the document has {doc.page_count} pages.")
+            with stage("extract"):
+                words = doc[page_num].get_text("words", sort=True)
+            for bbox in bboxes:
+                text = " ".join(word[4] for word in words if bbox.intersects(word[:4]))
+                if text:
+                    new_items[page_num].append(([bbox.x0, bbox.y0, bbox.x1, bbox.y1], text))
+            new_boxes[page_num].extend(bboxes)
+
+        if not new_boxes:
+            return document, encrypted_metadata
+        with stage("redact"):
+            for page_num, bboxes in new_boxes.items():
+                redact_page(doc[page_num], bboxes)
+        with stage("save"):
+            output = write_document(document.name, REDACTED_DIR, partial(save_reredacted_pdf, doc))
+    finally:
+        doc.close()
+
+    with stage("encrypt"):
+        return output, merge_metadata(encryption_key, encrypted_metadata, new_items)
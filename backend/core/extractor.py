@@ -1,33 +1,227 @@
+import math
+import os
 import fitz  
 from PIL import Image
-import pytesseract
-from typing import List, Dict, Any
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Dict, Any, Container, Iterator, Optional, Set, Tuple
 
-def extract_from_pdf(file_path: str) -> List[Dict[str, Any]]:
-    """Extracts text and bounding boxes from a PDF."""
-    document_data = []
-    doc = fitz.open(file_path)
+from .ocr import get_ocr_backend
+from .documents import Source, iter_frames, open_pdf, open_image
+from .metrics import stage
+
+# Bump when extraction output changes, to invalidate cached detections.
+EXTRACTOR_VERSION = "4"
+
+RENDER_DPI = int(os.environ.get("RENDER_DPI", 200))
+RENDER_GRAYSCALE = os.environ.get("RENDER_GRAYSCALE", "0") == "1"
+RENDER_MAX_DIMENSION = int(os.environ.get("RENDER_MAX_DIMENSION", 0)) or None
+
+OCR_DPI = int(os.environ.get("OCR_DPI", 300))
+# Pages with fewer text-layer characters than this (and at least one image) are OCR'd.
+OCR_MIN_TEXT_CHARS = int(os.environ.get("OCR_MIN_TEXT_CHARS", 20))
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", os.cpu_count() or 1))
+# Images larger than this many pixels are OCR'd in full-width bands of about this
+# size, in parallel. Bands overlap by OCR_TILE_OVERLAP pixels, which must exceed the
+# height of a line of text so that every line is whole in at least one band.
+OCR_TILE_PIXELS = int(os.environ.get("OCR_TILE_PIXELS", 16_000_000))
+OCR_TILE_OVERLAP = int(os.environ.get("OCR_TILE_OVERLAP", 256))
+
+_ocr_executor: Optional[ThreadPoolExecutor] = None
+
+def ocr_executor() -> ThreadPoolExecutor:
+    """Process-wide OCR thread pool, kept alive so OCR engines are reused across documents."""
+    global _ocr_executor
+    if _ocr_executor is None:
+        _ocr_executor = ThreadPoolExecutor(max_workers=max(1, OCR_WORKERS), thread_name_prefix="ocr")
+    return _ocr_executor
+
+def ocr_image(image: Image.Image) -> List[List[Any]]:
+    """OCRs one image and returns [x0, y0, x1, y1, word] boxes in pixels for confident words."""
+    return get_ocr_backend().ocr(image)
+
+def page_needs_ocr(page: fitz.Page, words: list) -> bool:
+    """True for pages without a usable text layer that have something to OCR."""
+    text_chars = sum(len(word[4]) for word in words)
+    return text_chars < OCR_MIN_TEXT_CHARS and bool(page.get_images())
+
+def _ocr_pdf_page(image: Image.Image, to_page: fitz.Matrix) -> List[List[Any]]:
+    """
+    OCRs a rendered page and maps the pixel boxes back to PDF points with to_page,
+    which also undoes the page's /Rotate, as get_text and redaction annotations
+    use the unrotated page.
+    """
+    try:
+        words = ocr_image(image)
+    except Exception as e:
+        print(f"Error during OCR: {e}")
+        return []
+    return [[*(fitz.Rect(x0, y0, x1, y1) * to_page), word] for x0, y0, x1, y1, word in words]
+
+def iter_pdf_words(doc: fitz.Document) -> Iterator[Tuple[int, list]]:
+    """
+    Yields (page_num, words) for every page of an open PDF, in page order.
+    Pages without a usable text layer are rasterized at OCR_DPI and OCR'd, several
+    pages at a time: up to 2 * OCR_WORKERS pages are read ahead while the oldest
+    OCR job finishes, so memory stays bounded however long the document is. Both
+    OCR backends release the GIL while recognizing, so threads keep every core
+    busy; rendering stays on this thread as fitz is not thread-safe.
+    """
+    scale = OCR_DPI / 72
+    executor = ocr_executor()
+    window: "deque[Tuple[int, Any]]" = deque()
     for page_num, page in enumerate(doc):
         words = page.get_text("words")
-        document_data.append({"page": page_num, "words": words})
-    return document_data
+        if page_needs_ocr(page, words):
+            with stage("ocr"):
+                pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), colorspace=fitz.csGRAY)
+                image = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+                to_page = fitz.Matrix(1 / scale, 1 / scale) * page.derotation_matrix
+                words = executor.submit(_ocr_pdf_page, image, to_page)
+        window.append((page_num, words))
+        while window and (len(window) > 2 * OCR_WORKERS or not isinstance(window[0][1], Future)):
+            yield _resolve_words(*window.popleft())
+    while window:
+        yield _resolve_words(*window.popleft())
+
+def _resolve_words(page_num: int, words: Any) -> Tuple[int, list]:
+    if not isinstance(words, Future):
+        return page_num, words
+    with stage("ocr"):
+        return page_num, words.result()
+
+def extract_from_pdf(source: Source) -> List[Dict[str, Any]]:
+    """Extracts text and bounding boxes from every page of a PDF, OCR'ing pages without a text layer."""
+    doc = open_pdf(source)
+    try:
+        return [{"page": page_num, "words": words} for page_num, words in iter_pdf_words(doc)]
+    finally:
+        doc.close()
 
 
-def extract_from_image(file_path: str) -> List[Dict[str, Any]]:
-    """Extracts text and bounding boxes from an image using OCR."""
+def pages_without_text_layer(source: Source) -> Set[int]:
+    """Numbers of the PDF pages that extraction OCRs, as they have no usable text layer."""
+    doc = open_pdf(source)
     try:
-        data = pytesseract.image_to_data(Image.open(file_path), output_type=pytesseract.Output.DICT)
-        words = []
-        n_boxes = len(data['level'])
-        for i in range(n_boxes):
-            if int(data['conf'][i]) > 60: 
-                (x, y, w, h) = (data['left'][i], data['top'][i], data['width'][i], data['height'][i])
-                word = data['text'][i]
-                if word.strip():
-                    words.append([x, y, x + w, y + h, word])
-        
-        return [{"page": 0, "words": words}]
+        return {page_num for page_num, page in enumerate(doc) if page_needs_ocr(page, page.get_text("words"))}
+    finally:
+        doc.close()
 
+
+def ocr_tiles(width: int, height: int, tile_pixels: int = OCR_TILE_PIXELS,
+              overlap: int = OCR_TILE_OVERLAP) -> List[Tuple[int, int, int, int]]:
+    """
+    Splits an image into overlapping full-width bands of about tile_pixels pixels,
+    returned as (top, bottom, keep_top, keep_bottom) rows. Bands run along the lines
+    of text, so only the line at a band edge can be cut, and it is whole in the
+    neighbouring band; a word belongs to the band whose [keep_top, keep_bottom)
+    holds its centre, so each word is kept exactly once.
+    """
+    tile_height = max(tile_pixels // max(width, 1), 2 * overlap)
+    if height <= tile_height:
+        return [(0, height, 0, height)]
+    # Bands are spread evenly, so none overlaps its neighbours by more than overlap.
+    count = math.ceil((height - overlap) / (tile_height - overlap))
+    step = math.ceil((height - overlap) / count)
+    bands = [(i * step, min(i * step + step + overlap, height)) for i in range(count)]
+    cuts = [0] + [(bottom + next_top) // 2 for (_, bottom), (next_top, _) in zip(bands, bands[1:])] + [height]
+    return [(top, bottom, cuts[i], cuts[i + 1]) for i, (top, bottom) in enumerate(bands)]
+
+def _ocr_tile(tile: Image.Image, top: int, keep_top: int, keep_bottom: int) -> List[List[Any]]:
+    """OCRs one band and returns the words it keeps, in the coordinates of the whole image."""
+    try:
+        words = ocr_image(tile)
     except Exception as e:
         print(f"Error during OCR: {e}")
-        return []
\ No newline at end of file
+        return []
+    return [
+        [x0, y0 + top, x1, y1 + top, word]
+        for x0, y0, x1, y1, word in words
+        if keep_top <= (y0 + y1) / 2 + top < keep_bottom
+    ]
+
+def iter_image_words(image: Image.Image, tile_pixels: int = OCR_TILE_PIXELS) -> Iterator[Tuple[int, list]]:
+    """
+    Yields (page_num, words) for every page of an open image (each frame of a
+    multi-page TIFF), in page order. Pages are OCR'd in bands (see ocr_tiles) on the
+    OCR thread pool, so the bands of one large scan, or the pages of a long fax,
+    are recognized in parallel. At most 2 * OCR_WORKERS bands are queued at a time
+    and only the current page is decoded, so memory stays bounded; large pages'
+    bands are converted to greyscale before they are queued.
+    """
+    executor = ocr_executor()
+    queued: "deque[Future]" = deque()
+    window: "deque[Tuple[int, List[Future]]]" = deque()
+    for page_num, frame in iter_frames(image):
+        width, height = frame.size
+        tiles = ocr_tiles(width, height, tile_pixels)
+        futures = []
+        for top, bottom, keep_top, keep_bottom in tiles:
+            with stage("ocr"):
+                while len(queued) >= 2 * OCR_WORKERS:
+                    queued.popleft().result()
+                tile = frame.crop((0, top, width, bottom))
+                if len(tiles) > 1 and tile.mode not in ("1", "L"):
+                    tile = tile.convert("L")
+                futures.append(executor.submit(_ocr_tile, tile, top, keep_top, keep_bottom))
+            queued.append(futures[-1])
+        window.append((page_num, futures))
+        while window and all(future.done() for future in window[0][1]):
+            yield _resolve_tiles(*window.popleft())
+    while window:
+        yield _resolve_tiles(*window.popleft())
+
+def _resolve_tiles(page_num: int, futures: List[Future]) -> Tuple[int, list]:
+    with stage("ocr"):
+        return page_num, [word for future in futures for word in future.result()]
+
+def extract_from_image(source: Source) -> List[Dict[str, Any]]:
+    """Extracts text and bounding boxes from every page of an image using OCR."""
+    try:
+        with open_image(source) as image:
+            return [{"page": page_num, "words": words} for page_num, words in iter_image_words(image)]
+
+    except Exception as e:
+        print(f"Error during OCR: {e}")
+        return []
+
+
+def render_pdf_pages(source: Source, dpi: int = RENDER_DPI, grayscale: bool = RENDER_GRAYSCALE,
+                     max_dimension: Optional[int] = RENDER_MAX_DIMENSION,
+                     pages: Optional[Container[int]] = None) -> Iterator[Tuple[int, Image.Image]]:
+    """
+    Renders a PDF one page at a time into in-memory PIL images, yielding (page_num, image).
+    Pages are only rendered when the caller asks for the next one, and the longest
+    side of each image is capped at max_dimension pixels when it is set.
+    With pages set, only those page numbers are rendered.
+    """
+    doc = open_pdf(source)
+    try:
+        for page_num, page in enumerate(doc):
+            if pages is not None and page_num not in pages:
+                continue
+            scale = dpi / 72
+            if max_dimension:
+                scale = min(scale, max_dimension / max(page.rect.width, page.rect.height))
+            pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), colorspace=fitz.csGRAY if grayscale else fitz.csRGB)
+            mode = "L" if grayscale else "RGB"
+            yield page_num, Image.frombytes(mode, (pix.width, pix.height), pix.samples)
+    finally:
+        doc.close()
+
+
+def render_image_pages(source: Source, max_dimension: Optional[int] = RENDER_MAX_DIMENSION,
+                       pages: Optional[Container[int]] = None) -> Iterator[Tuple[int, Image.Image]]:
+    """
+    Like render_pdf_pages, for the pages of an image: yields (page_num, image) for
+    each page (TIFF frame), one at a time, optionally only those in pages.
+    """
+    with open_image(source) as image:
+        for page_num, frame in iter_frames(image):
+            if pages is not None and page_num not in pages:
+                continue
+            scale = min(1.0, max_dimension / max(frame.size)) if max_dimension else 1.0
+            if scale < 1:
+                yield page_num, frame.resize((max(1, round(frame.width * scale)), max(1, round(frame.height * scale))))
+            else:
+                yield page_num, frame.copy()
@@ -1,56 +1,95 @@
-import re
-import spacy
-from typing import List, Dict
-
-try:
-    nlp = spacy.load("en_core_web_sm")
-except OSError:
-    print("Downloading spaCy model 'en_core_web_sm'...")
-    from spacy.cli import download
-    download("en_core_web_sm")
-    nlp = spacy.load("en_core_web_sm")
-
-REGEX_PATTERNS = {
-    "EMAIL": re.compile(r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+"),
-    "PHONE": re.compile(r"\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}"),
-    "PNR": re.compile(r"\b\d{10}\b"),
-    "TRANSACTION_ID": re.compile(r"Transaction ID:\s*(\d+)"),
-    "INVOICE_NUMBER": re.compile(r"Invoice Number:\s*([A-Z0-9]+)"),
-}
+import os
+from functools import lru_cache
+from importlib import metadata
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .patterns import PATTERN_REGISTRY, compile_scanner
+
+SPACY_MODEL = "en_core_web_sm"
+# Only doc.ents is used. In en_core_web_sm the ner component has its own
+# tok2vec, so everything else can be left out of the pipeline.
+SPACY_EXCLUDE = ["tok2vec", "tagger", "parser", "attribute_ruler", "lemmatizer", "senter"]
+SPACY_BATCH_SIZE = int(os.environ.get("SPACY_BATCH_SIZE", 32))
+# Documents with at least SPACY_N_PROCESS_MIN_PAGES pages are split across SPACY_N_PROCESS processes.
+SPACY_N_PROCESS = int(os.environ.get("SPACY_N_PROCESS", 1))
+SPACY_N_PROCESS_MIN_PAGES = int(os.environ.get("SPACY_N_PROCESS_MIN_PAGES", 200))
+# Bump when the patterns or the detection logic change, to invalidate cached detections.
+DETECTOR_VERSION = "3"
+
+@lru_cache(maxsize=None)
+def get_nlp():
+    """Loads the NER-only spaCy pipeline on first use, so the LLM engine never pays for it."""
+    import spacy
+    try:
+        return spacy.load(SPACY_MODEL, exclude=SPACY_EXCLUDE)
+    except OSError:
+        print("Downloading spaCy model 'en_core_web_sm'...")
+        from spacy.cli import download
+        download(SPACY_MODEL)
+        return spacy.load(SPACY_MODEL, exclude=SPACY_EXCLUDE)
 
 SEVERITY_MAPPING = {
     0: [],
-    20: ["CREDIT_CARD", "SSN"],
-    40: ["CREDIT_CARD", "SSN", "EMAIL", "PHONE", "PNR", "TRANSACTION_ID", "INVOICE_NUMBER"],
-    60: ["CREDIT_CARD", "SSN", "EMAIL", "PHONE", "PNR", "TRANSACTION_ID", "INVOICE_NUMBER", "PERSON"],
-    80: ["CREDIT_CARD", "SSN", "EMAIL", "PHONE", "PNR", "TRANSACTION_ID", "INVOICE_NUMBER", "PERSON", "GPE", "DATE"],
-    100: ["CREDIT_CARD", "SSN", "EMAIL", "PHONE", "PNR", "TRANSACTION_ID", "INVOICE_NUMBER", "PERSON", "GPE", "DATE", "ORG"],
+    20: ["CREDIT_CARD", "SSN", "IBAN", "PASSPORT"],
+    40: ["CREDIT_CARD", "SSN", "IBAN", "PASSPORT", "EMAIL", "PHONE", "PNR", "TRANSACTION_ID", "INVOICE_NUMBER"],
+    60: ["CREDIT_CARD", "SSN", "IBAN", "PASSPORT", "EMAIL", "PHONE", "PNR", "TRANSACTION_ID", "INVOICE_NUMBER", "PERSON"],
+    80: ["CREDIT_CARD", "SSN", "IBAN", "PASSPORT", "EMAIL", "PHONE", "PNR", "TRANSACTION_ID", "INVOICE_NUMBER", "PERSON", "GPE", "DATE"],
+    100: ["CREDIT_CARD", "SSN", "IBAN", "PASSPORT", "EMAIL", "PHONE", "PNR", "TRANSACTION_ID", "INVOICE_NUMBER", "PERSON", "GPE", "DATE", "ORG"],
 }
 
-def find_pii_classic(text: str, severity: int) -> List[Dict[str, int]]:
+MAX_SEVERITY = max(SEVERITY_MAPPING)
+
+def model_version() -> str:
+    """Identifies the detector for cache keys: spaCy model, its version and DETECTOR_VERSION."""
+    try:
+        spacy_version = metadata.version(SPACY_MODEL)
+    except metadata.PackageNotFoundError:
+        spacy_version = "unknown"
+    return f"{SPACY_MODEL}-{spacy_version}-{DETECTOR_VERSION}"
+
+def filter_by_severity(pii_list: List[Dict], severity: int) -> List[Dict]:
+    """Keeps only the detections whose label is redacted at the given severity."""
+    allowed = SEVERITY_MAPPING.get(severity, [])
+    return [pii for pii in pii_list if pii["label"] in allowed]
+
+def default_n_process(page_count: int) -> int:
+    """SPACY_N_PROCESS for documents with at least SPACY_N_PROCESS_MIN_PAGES pages, else 1."""
+    return SPACY_N_PROCESS if page_count >= SPACY_N_PROCESS_MIN_PAGES else 1
+
+def iter_pii_classic(pages: Iterable[Tuple[str, Any]], severity: int, n_process: int = 1) -> Iterator[Tuple[List[Dict[str, int]], Any]]:
     """
-    Finds PII using Regex and spaCy NER.
+    Streaming form of find_pii_classic_batch. Takes (text, context) pairs and yields
+    (pii, context) in the same order, so callers can carry page data alongside the
+    text. Only the texts in the current NER batch are held at any time.
     """
     pii_to_find = SEVERITY_MAPPING.get(severity, [])
-    if not pii_to_find:
-        return []
-
-    found_pii = []
-
-    for pii_type, pattern in REGEX_PATTERNS.items():
-        if pii_type in pii_to_find:
-            for match in pattern.finditer(text):
-                try:
-                    start, end = match.span(1)
-                except IndexError:
-                    start, end = match.span()
-                found_pii.append({"start": start, "end": end, "label": pii_type})
-
-    ner_types = [ptype for ptype in pii_to_find if ptype not in REGEX_PATTERNS]
-    if ner_types:
-        doc = nlp(text)
+    scanner = compile_scanner(tuple(pii_to_find))
+    ner_types = [ptype for ptype in pii_to_find if ptype not in PATTERN_REGISTRY]
+    if not ner_types:
+        for text, context in pages:
+            yield scanner.scan(text), context
+        return
+
+    docs = get_nlp().pipe(pages, as_tuples=True, batch_size=SPACY_BATCH_SIZE, n_process=n_process)
+    for doc, context in docs:
+        page_pii = scanner.scan(doc.text)
         for ent in doc.ents:
             if ent.label_ in ner_types:
-                found_pii.append({"start": ent.start_char, "end": ent.end_char, "label": ent.label_})
+                page_pii.append({"start": ent.start_char, "end": ent.end_char, "label": ent.label_})
+        yield page_pii, context
+
+def find_pii_classic_batch(texts: List[str], severity: int, n_process: Optional[int] = None) -> List[List[Dict[str, int]]]:
+    """
+    Finds PII using Regex and spaCy NER in several texts (e.g. all pages of a document).
+    NER runs through nlp.pipe in batches of SPACY_BATCH_SIZE. n_process defaults to
+    SPACY_N_PROCESS for documents with at least SPACY_N_PROCESS_MIN_PAGES pages, else 1.
+    """
+    if n_process is None:
+        n_process = default_n_process(len(texts))
+    return [page_pii for page_pii, _ in iter_pii_classic(((text, None) for text in texts), severity, n_process)]
 
-    return found_pii
\ No newline at end of file
+def find_pii_classic(text: str, severity: int) -> List[Dict[str, int]]:
+    """
+    Finds PII using Regex and spaCy NER.
+    """
+    return find_pii_classic_batch([text], severity, n_process=1)[0]
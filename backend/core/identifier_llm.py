@@ -2,7 +2,7 @@ import os
 import json
 import google.generativeai as genai
 from PIL import Image
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Tuple, Union
 
 try:
     genai.configure(api_key=os.environ.get("GOOGLE_API_KEY"))
@@ -15,7 +15,18 @@ safety_settings = [
     {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
     {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
 ]
-model = genai.GenerativeModel('gemini-2.5-flash', safety_settings=safety_settings)
+MODEL_NAME = 'gemini-2.5-flash'
+# Bump when a prompt changes, to invalidate cached detections.
+PROMPT_VERSION = "1"
+TEXT_PROMPT_VERSION = "1"
+# "vision" sends every page as an image; "text" sends the words of pages with a
+# usable text layer, several pages per request, and images only for the rest.
+LLM_MODES = ("vision", "text")
+LLM_MODE = os.environ.get("LLM_MODE", "vision")
+# Text mode packs pages into one request until their estimated size reaches this many tokens.
+LLM_TEXT_TOKEN_BUDGET = int(os.environ.get("LLM_TEXT_TOKEN_BUDGET", 8000))
+CHARS_PER_TOKEN = 4
+model = genai.GenerativeModel(MODEL_NAME, safety_settings=safety_settings)
 
 SEVERITY_MAPPING = {
     0: [],
@@ -25,26 +36,84 @@ SEVERITY_MAPPING = {
     80: ["CREDIT_CARD", "SSN", "EMAIL", "PHONE", "PNR", "TRANSACTION_ID", "INVOICE_NUMBER", "PERSON", "GPE", "DATE"],
     100: ["ALL_POSSIBLE_PII"],
 }
+MAX_SEVERITY = max(SEVERITY_MAPPING)
+KNOWN_LABELS = SEVERITY_MAPPING[80]
+# Names the model uses for KNOWN_LABELS despite the prompt, after normalize_label's cleanup.
+LABEL_SYNONYMS = {
+    "NAME": "PERSON", "FULL_NAME": "PERSON", "PERSON_NAME": "PERSON",
+    "CREDIT_CARD_NUMBER": "CREDIT_CARD", "CARD_NUMBER": "CREDIT_CARD",
+    "SOCIAL_SECURITY_NUMBER": "SSN",
+    "E_MAIL": "EMAIL", "EMAIL_ADDRESS": "EMAIL", "E_MAIL_ADDRESS": "EMAIL",
+    "PHONE_NUMBER": "PHONE", "TELEPHONE": "PHONE", "TELEPHONE_NUMBER": "PHONE", "MOBILE": "PHONE", "MOBILE_NUMBER": "PHONE",
+    "BOOKING_REFERENCE": "PNR", "PNR_NUMBER": "PNR",
+    "TRANSACTION": "TRANSACTION_ID", "TRANSACTION_NUMBER": "TRANSACTION_ID",
+    "INVOICE": "INVOICE_NUMBER", "INVOICE_ID": "INVOICE_NUMBER", "INVOICE_NO": "INVOICE_NUMBER",
+    "LOCATION": "GPE", "ADDRESS": "GPE", "CITY": "GPE", "STATE": "GPE", "COUNTRY": "GPE",
+    "DATE_OF_BIRTH": "DATE", "DOB": "DATE", "BIRTH_DATE": "DATE",
+}
+
+
+def model_version(mode: str = "vision") -> str:
+    if mode == "text":
+        return f"{MODEL_NAME}-{PROMPT_VERSION}-text{TEXT_PROMPT_VERSION}"
+    return f"{MODEL_NAME}-{PROMPT_VERSION}"
+
 
+def normalize_label(label: Any) -> str:
+    """Upper-cases a model's label, joins its words with "_" and maps LABEL_SYNONYMS onto KNOWN_LABELS."""
+    label = "_".join(str(label or "").upper().replace("-", " ").split())
+    return LABEL_SYNONYMS.get(label, label)
 
-def identify_pii_text_with_vision(image_path: str, severity: int) -> List[Dict[str, str]]:
+
+def filter_by_severity(pii_list: List[Dict[str, str]], severity: int) -> List[Dict[str, str]]:
     """
-    Identifies PII text from an image using Gemini Vision.
-    This version DOES NOT ask for bounding boxes, only for the text and label.
+    Keeps only the detections whose normalized label is redacted at the given severity.
+    Detections made at MAX_SEVERITY use KNOWN_LABELS where one applies, so they
+    can be filtered down to any lower severity.
     """
+    allowed = SEVERITY_MAPPING.get(severity, [])
+    if "ALL_POSSIBLE_PII" in allowed:
+        return list(pii_list)
+    return [pii for pii in pii_list if normalize_label(pii.get("label")) in allowed]
+
+
+def _prompt_labels(severity: int) -> str:
+    """The PII types to ask for at severity, as listed in the prompts; empty if there are none."""
     pii_to_find = SEVERITY_MAPPING.get(severity)
     if not pii_to_find:
-        return []
-
+        return ""
     pii_list_str = ", ".join(pii_to_find)
     if "ALL_POSSIBLE_PII" in pii_list_str:
-        pii_list_str = "all possible PII..."
+        pii_list_str = (f"all possible PII. Label each with one of {', '.join(KNOWN_LABELS)} where one applies, "
+                        f"otherwise with a short upper-case category name")
+    return pii_list_str
 
-    try:
-        image = Image.open(image_path)
-    except Exception as e:
-        print(f"Could not open image file at {image_path}: {e}")
+
+def _parse_response(response_text: str) -> Any:
+    if response_text.startswith("```json"):
+        response_text = response_text.strip("```json\n").strip("`\n")
+    return json.loads(response_text)
+
+
+def identify_pii_text_with_vision(image: Union[str, Image.Image], severity: int, llm_model: Any = None, raise_errors: bool = False) -> List[Dict[str, str]]:
+    """
+    Identifies PII text from an image using Gemini Vision.
+    This version DOES NOT ask for bounding boxes, only for the text and label.
+    image is either a path or an already loaded PIL image.
+    llm_model defaults to the module's Gemini model; anything with a compatible
+    generate_content() can be passed instead. With raise_errors, API errors are
+    raised instead of returning [], so callers can retry them.
+    """
+    pii_list_str = _prompt_labels(severity)
+    if not pii_list_str:
         return []
+
+    if isinstance(image, str):
+        try:
+            image = Image.open(image)
+        except Exception as e:
+            print(f"Could not open image file at {image}: {e}")
+            return []
         
     prompt = f"""
     You are an expert data security analyst. Analyze the provided document image and identify all instances of the following PII types: [{pii_list_str}].
@@ -62,16 +131,127 @@ def identify_pii_text_with_vision(image_path: str, severity: int) -> List[Dict[s
     """
 
     try:
-        response = model.generate_content([prompt, image], stream=False)
-        response_text = response.text
-        if response_text.startswith("```json"):
-            response_text = response_text.strip("```json\n").strip("`\n")
-            
-        pii_list = json.loads(response_text)
-        return pii_list
+        response = (llm_model or model).generate_content([prompt, image], stream=False)
+        return _parse_response(response.text)
 
     except Exception as e:
+        if raise_errors:
+            raise
         print(f"An error occurred with the Google Gemini API call: {e}")
         return []
 
-find_pii = identify_pii_text_with_vision
\ No newline at end of file
+# Pages sent in text mode: (page_num, the page's words in reading order).
+TextPage = Tuple[int, List[str]]
+
+
+def estimate_tokens(words: List[str]) -> int:
+    """Rough token count of a page as formatted for the text prompt."""
+    return sum(len(word) + len(str(index)) + 2 for index, word in enumerate(words)) // CHARS_PER_TOKEN + 1
+
+
+def pack_pages(pages: Iterable[TextPage], token_budget: int = LLM_TEXT_TOKEN_BUDGET) -> Iterator[List[TextPage]]:
+    """Groups consecutive pages into batches of at most token_budget estimated tokens; a larger page is sent alone."""
+    batch, batch_tokens = [], 0
+    for page_num, words in pages:
+        tokens = estimate_tokens(words)
+        if batch and batch_tokens + tokens > token_budget:
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append((page_num, words))
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+def _format_page(page_num: int, words: List[str]) -> str:
+    numbered = " ".join(f"{index}:{word}" for index, word in enumerate(words))
+    return f'<page number="{page_num}">\n{numbered}\n</page>'
+
+
+def _span_detection(item: Dict[str, Any], words_by_page: Dict[int, List[str]]) -> Tuple[int, Dict[str, Any]]:
+    """
+    Checks one {"page", "start", "end", "label"} answer against the words sent and
+    returns (page_num, detection) with word_start/word_end (exclusive) and the
+    text of those words. Raises ValueError for spans outside the pages sent.
+    """
+    page_num, start, end = int(item["page"]), int(item["start"]), int(item["end"])
+    words = words_by_page.get(page_num)
+    if words is None or not 0 <= start <= end < len(words):
+        raise ValueError(f"span {start}-{end} is not on page {page_num}")
+    return page_num, {
+        "text": " ".join(words[start:end + 1]),
+        "label": item.get("label", ""),
+        "word_start": start,
+        "word_end": end + 1,
+    }
+
+
+def identify_pii_in_text(pages: List[TextPage], severity: int, llm_model: Any = None,
+                         raise_errors: bool = False) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    Identifies PII in the words of one or more pages with a single text request.
+    The model answers with word-index spans, which map directly onto the words
+    sent. Returns {page_num: [{"text", "label", "word_start", "word_end"}]} for
+    every page sent; invalid spans are skipped. llm_model and raise_errors are
+    as for identify_pii_text_with_vision.
+    """
+    words_by_page = dict(pages)
+    results: Dict[int, List[Dict[str, Any]]] = {page_num: [] for page_num in words_by_page}
+    pii_list_str = _prompt_labels(severity)
+    if not pii_list_str:
+        return results
+
+    page_blocks = "\n".join(_format_page(page_num, words) for page_num, words in pages)
+    prompt = f"""
+    You are an expert data security analyst. Below are the words of {len(pages)} document page(s).
+    Each page is in a <page number="N"> element, and each word is prefixed with its index on that page, as index:word.
+    Identify all instances of the following PII types: [{pii_list_str}].
+
+    You must respond ONLY with a valid JSON object. Do not include markdown or explanations.
+    The JSON object must be a list of PII objects. Each object MUST have these exact keys:
+    - "page": The number of the page the PII is on.
+    - "start": The index of the first word of the PII.
+    - "end": The index of the last word of the PII.
+    - "label": The category of the PII (e.g., "PERSON", "PNR").
+
+    Example of a valid response:
+    [
+      {{"page": 0, "start": 4, "end": 5, "label": "PERSON"}},
+      {{"page": 2, "start": 17, "end": 17, "label": "EMAIL"}}
+    ]
+
+{page_blocks}
+    """
+
+    try:
+        response = (llm_model or model).generate_content([prompt], stream=False)
+        pii_list = _parse_response(response.text)
+    except Exception as e:
+        if raise_errors:
+            raise
+        print(f"An error occurred with the Google Gemini API call: {e}")
+        return results
+
+    for item in pii_list:
+        if "start" not in item and item.get("text") and item.get("page") in results:
+            # Answered like the vision prompt; the text is still matched on every page.
+            results[item["page"]].append({"text": item["text"], "label": item.get("label", "")})
+            continue
+        try:
+            page_num, detection = _span_detection(item, words_by_page)
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Warning: Skipping an invalid PII span from the LLM: {e}")
+            continue
+        results[page_num].append(detection)
+    return results
+
+
+def find_pii_any(request: Union[List[TextPage], str, Image.Image], severity: int, llm_model: Any = None,
+                 raise_errors: bool = False) -> Union[Dict[int, List[Dict[str, Any]]], List[Dict[str, str]]]:
+    """identify_pii_in_text for a list of text pages, identify_pii_text_with_vision for an image."""
+    if isinstance(request, list):
+        return identify_pii_in_text(request, severity, llm_model, raise_errors)
+    return identify_pii_text_with_vision(request, severity, llm_model, raise_errors)
+
+
+find_pii = identify_pii_text_with_vision
@@ -0,0 +1,255 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import multiprocessing
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+from .metadata import METADATA_VERSION
+from .documents import save_document
+
+JOB_STORE = os.environ.get("JOB_STORE", "memory")
+JOB_STORE_PATH = os.environ.get("JOB_STORE_PATH", "jobs.sqlite3")
+# Queued/running jobs with no progress for this long are reported as failed,
+# which is what happens to jobs whose worker was restarted.
+JOB_STALE_SECONDS = int(os.environ.get("JOB_STALE_SECONDS", 15 * 60))
+# Jobs, and their redacted output, are deleted this long after their last update.
+JOB_RESULT_TTL_SECONDS = int(os.environ.get("JOB_RESULT_TTL_SECONDS", 24 * 60 * 60))
+JOB_SWEEP_INTERVAL_SECONDS = int(os.environ.get("JOB_SWEEP_INTERVAL_SECONDS", 10 * 60))
+
+JOB_FIELDS = ("id", "status", "stage", "pages_done", "pages_total", "error", "params", "result", "created_at", "updated_at")
+
+
+class JobStore(ABC):
+    """
+    Stores job status and results. Subclasses must be safe to call from several threads.
+    A job is a dict with the keys in JOB_FIELDS; params and result are JSON-serialisable dicts.
+    Results never hold the decryption key, which only the client keeps.
+    """
+
+    @abstractmethod
+    def create(self, job_id: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def update(self, job_id: str, **fields: Any):
+        ...
+
+    @abstractmethod
+    def update_progress(self, job_id: str, stage: str, pages_done: int, pages_total: int):
+        """Like update(), but only while the job is queued or running, so late events cannot undo a finish."""
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def delete(self, job_id: str):
+        ...
+
+    @abstractmethod
+    def expire(self, updated_before: float) -> List[Dict[str, Any]]:
+        """Deletes the jobs last updated before updated_before and returns them."""
+
+    @staticmethod
+    def new_job(job_id: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        now = time.time()
+        return {"id": job_id, "status": "queued", "stage": "queued", "pages_done": 0, "pages_total": 0,
+                "error": None, "params": params, "result": None, "created_at": now, "updated_at": now}
+
+
+class InMemoryJobStore(JobStore):
+    """Keeps jobs in a dict. Jobs are lost when the process exits."""
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def create(self, job_id, params):
+        job = self.new_job(job_id, params)
+        with self._lock:
+            self._jobs[job_id] = job
+        return dict(job)
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields, updated_at=time.time())
+
+    def update_progress(self, job_id, stage, pages_done, pages_total):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job and job["status"] in ("queued", "running"):
+                job.update(status="running", stage=stage, pages_done=pages_done, pages_total=pages_total,
+                           updated_at=time.time())
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def delete(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def expire(self, updated_before):
+        with self._lock:
+            expired = [job for job in self._jobs.values() if job["updated_at"] < updated_before]
+            for job in expired:
+                del self._jobs[job["id"]]
+        return expired
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Keeps jobs in a SQLite file so they survive restarts and can be read by
+    every uvicorn worker that points at the same file.
+    """
+
+    def __init__(self, path: str = JOB_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT, stage TEXT, pages_done INTEGER, pages_total INTEGER, "
+                "error TEXT, params TEXT, result TEXT, created_at REAL, updated_at REAL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def create(self, job_id, params):
+        job = self.new_job(job_id, params)
+        row = {**job, "params": json.dumps(params), "result": None}
+        with self._lock, self._connect() as conn:
+            conn.execute(f"INSERT INTO jobs ({', '.join(JOB_FIELDS)}) VALUES ({', '.join('?' * len(JOB_FIELDS))})",
+                         [row[f] for f in JOB_FIELDS])
+        return job
+
+    def update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        for key in ("params", "result"):
+            if key in fields:
+                fields[key] = json.dumps(fields[key])
+        assignments = ", ".join(f"{key} = ?" for key in fields if key in JOB_FIELDS)
+        values = [value for key, value in fields.items() if key in JOB_FIELDS]
+        with self._lock, self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", values + [job_id])
+
+    def update_progress(self, job_id, stage, pages_done, pages_total):
+        with self._lock, self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = 'running', stage = ?, pages_done = ?, pages_total = ?, updated_at = ? "
+                         "WHERE id = ? AND status IN ('queued', 'running')",
+                         (stage, pages_done, pages_total, time.time(), job_id))
+
+    def get(self, job_id):
+        with self._lock, self._connect() as conn:
+            row = conn.execute(f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row is not None else None
+
+    @staticmethod
+    def _job(row: tuple) -> Dict[str, Any]:
+        job = dict(zip(JOB_FIELDS, row))
+        for key in ("params", "result"):
+            job[key] = json.loads(job[key]) if job[key] else None
+        return job
+
+    def delete(self, job_id):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def expire(self, updated_before):
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE updated_at < ?", (updated_before,)).fetchall()
+            conn.execute("DELETE FROM jobs WHERE updated_at < ?", (updated_before,))
+        return [self._job(row) for row in rows]
+
+
+def is_stale(job: Dict[str, Any]) -> bool:
+    return job["status"] in ("queued", "running") and time.time() - job["updated_at"] > JOB_STALE_SECONDS
+
+
+def expire_jobs(store: JobStore, ttl: float = JOB_RESULT_TTL_SECONDS) -> int:
+    """Deletes jobs not updated for ttl seconds, with their redacted output; returns how many."""
+    expired = store.expire(time.time() - ttl)
+    for job in expired:
+        path = (job["result"] or {}).get("redactedFilePath")
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"Error removing expired job output {path}: {e}")
+    return len(expired)
+
+
+def make_job_store(kind: str = JOB_STORE) -> JobStore:
+    if kind == "memory":
+        return InMemoryJobStore()
+    if kind == "sqlite":
+        return SQLiteJobStore(JOB_STORE_PATH)
+    raise ValueError(f"Unknown job store: {kind}")
+
+
+class ProgressRelay:
+    """
+    Carries progress events from pool workers back to the job store.
+    Workers put (job_id, stage, pages_done, pages_total) on a manager queue,
+    and a thread in the API process writes them to the store.
+    """
+
+    def __init__(self, store: JobStore):
+        self.store = store
+        self.queue = None
+        self._manager = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._manager = multiprocessing.get_context("spawn").Manager()
+        self.queue = self._manager.Queue()
+        self._thread = threading.Thread(target=self._drain, daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        if self.queue is not None:
+            self.queue.put(None)
+            self._thread.join(timeout=5)
+            self._manager.shutdown()
+            self.queue = None
+
+    def _drain(self):
+        while True:
+            event = self.queue.get()
+            if event is None:
+                return
+            self.store.update_progress(*event)
+
+
+class _QueueProgress:
+    """Picklable progress callback that forwards events to a ProgressRelay queue."""
+
+    def __init__(self, job_id: str, queue):
+        self.job_id = job_id
+        self.queue = queue
+
+    def __call__(self, stage: str, pages_done: int, pages_total: int):
+        self.queue.put((self.job_id, stage, pages_done, pages_total))
+
+
+def run_job(job_id: str, engine: str, input_path: str, severity: int, key: bytes, queue,
+            metadata_version: int = METADATA_VERSION, llm_mode: Optional[str] = None) -> tuple:
+    """
+    Entry point executed in a pool worker for one job. Returns (redacted_file_path, metadata):
+    results wait in the job store until fetched, so the output is always written to disk.
+    """
+    from .engine import process_document_llm, process_document_classic, REDACTED_DIR, LLM_MODE
+
+    progress = _QueueProgress(job_id, queue)
+    if engine == "llm":
+        output, metadata = process_document_llm(input_path, severity, key, progress, metadata_version=metadata_version,
+                                                mode=llm_mode or LLM_MODE)
+    else:
+        output, metadata = process_document_classic(input_path, severity, key, progress, metadata_version=metadata_version)
+    return save_document(output, REDACTED_DIR), metadata
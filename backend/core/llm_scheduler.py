@@ -0,0 +1,181 @@
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing.managers import BaseManager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Defaults roughly match the old pacing of one request every 5 seconds; raise
+# them to the actual Gemini quota of the API key in use. The request rate (and
+# its burst of LLM_MAX_IN_FLIGHT) is for the whole service: pool workers share one
+# bucket. LLM_MAX_IN_FLIGHT also caps the concurrent requests of each document.
+LLM_REQUESTS_PER_MINUTE = float(os.environ.get("LLM_REQUESTS_PER_MINUTE", 12))
+LLM_MAX_IN_FLIGHT = int(os.environ.get("LLM_MAX_IN_FLIGHT", 4))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 5))
+LLM_BACKOFF_BASE_SECONDS = float(os.environ.get("LLM_BACKOFF_BASE_SECONDS", 2))
+LLM_BACKOFF_MAX_SECONDS = float(os.environ.get("LLM_BACKOFF_MAX_SECONDS", 60))
+
+_NO_FALLBACK = object()
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: refills at requests_per_minute and holds at most
+    capacity tokens, so short bursts are allowed but the average rate is capped.
+    """
+
+    def __init__(self, requests_per_minute: float, capacity: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else 1.0
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Takes a token and returns 0 if one is available, otherwise the seconds until one will be."""
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """Blocks until a token is available and takes it."""
+        while True:
+            delay = self.reserve()
+            if delay <= 0:
+                return
+            self.sleep(delay)
+
+
+class SharedTokenBucket:
+    """
+    A TokenBucket held by a manager process, so that several processes draw from
+    one rate. Picklable, to be handed to pool workers; waiting happens in the caller.
+    """
+
+    def __init__(self, bucket: Any, sleep: Callable[[float], None] = time.sleep):
+        self.bucket = bucket
+        self.sleep = sleep
+
+    def acquire(self):
+        while True:
+            delay = self.bucket.reserve()
+            if delay <= 0:
+                return
+            self.sleep(delay)
+
+
+class _BucketManager(BaseManager):
+    pass
+
+
+_BucketManager.register("TokenBucket", TokenBucket, exposed=("reserve",))
+
+
+def start_shared_bucket(context: Any = None, requests_per_minute: float = LLM_REQUESTS_PER_MINUTE,
+                        capacity: float = LLM_MAX_IN_FLIGHT) -> Tuple[BaseManager, SharedTokenBucket]:
+    """Starts a manager process holding one TokenBucket; returns the manager, to shut down later, and the bucket."""
+    manager = _BucketManager(ctx=context)
+    manager.start()
+    return manager, SharedTokenBucket(manager.TokenBucket(requests_per_minute, capacity))
+
+
+# Shared by every document processed in this process so concurrent jobs stay within one quota.
+# Pool workers replace it with the pool's SharedTokenBucket (see use_bucket).
+default_bucket = TokenBucket(LLM_REQUESTS_PER_MINUTE, capacity=LLM_MAX_IN_FLIGHT)
+
+
+def use_bucket(bucket: Any):
+    """Makes bucket the default for LLMPageScheduler in this process."""
+    global default_bucket
+    default_bucket = bucket
+
+
+def is_retryable(error: Exception) -> bool:
+    """True for rate-limit (429) and server (5xx) errors, as raised by google.api_core or a fake."""
+    status = getattr(error, "code", None) or getattr(error, "status_code", None)
+    try:
+        status = int(status)
+    except (TypeError, ValueError):
+        return False
+    return status == 429 or 500 <= status < 600
+
+
+class LLMPageScheduler:
+    """
+    Sends one LLM request per item concurrently, limited by a token bucket and
+    max_in_flight, retrying 429/5xx errors with exponential backoff and jitter.
+    Results are returned in the same order as the items.
+    """
+
+    def __init__(self, call: Callable[[Any], Any], bucket: Optional[TokenBucket] = None,
+                 max_in_flight: int = LLM_MAX_IN_FLIGHT, max_retries: int = LLM_MAX_RETRIES,
+                 backoff_base: float = LLM_BACKOFF_BASE_SECONDS, backoff_max: float = LLM_BACKOFF_MAX_SECONDS,
+                 fallback: Any = _NO_FALLBACK, sleep: Callable[[float], None] = time.sleep):
+        self.call = call
+        self.bucket = bucket or default_bucket
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.fallback = fallback
+        self.sleep = sleep
+
+    def backoff(self, attempt: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+    def call_with_retry(self, item: Any) -> Any:
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            try:
+                return self.call(item)
+            except Exception as e:
+                if is_retryable(e) and attempt < self.max_retries:
+                    delay = self.backoff(attempt)
+                    print(f"LLM request failed ({e}), retrying in {delay:.1f} seconds...")
+                    self.sleep(delay)
+                    attempt += 1
+                    continue
+                if self.fallback is _NO_FALLBACK:
+                    raise
+                print(f"An error occurred with the LLM request: {e}")
+                return self.fallback
+
+    def run(self, items: Iterable[Any], on_done: Optional[Callable[[int], None]] = None) -> List[Any]:
+        """
+        Processes all items and returns their results in order.
+        items may be a lazy iterator: it is only advanced while fewer than
+        2 * max_in_flight items are outstanding, so producing the next item
+        (e.g. rendering a page) overlaps with inference without piling up.
+        on_done(n) is called with the number of finished items after each one completes.
+        """
+        results: Dict[int, Any] = {}
+        max_outstanding = 2 * self.max_in_flight
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            pending = {}
+
+            def collect(futures):
+                for future in futures:
+                    results[pending.pop(future)] = future.result()
+                    if on_done is not None:
+                        on_done(len(results))
+
+            for index, item in enumerate(items):
+                pending[executor.submit(self.call_with_retry, item)] = index
+                if len(pending) >= max_outstanding:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        return [results[index] for index in range(len(results))]
@@ -0,0 +1,169 @@
+import os
+import struct
+import zlib
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from typing import Any, Dict, Iterator, List, Mapping, Sequence, Tuple
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from .security import NONCE_SIZE, encrypt_text, decrypt_text
+
+# Version 1 encrypts every PII item separately: {"pages": {page: [{"encrypted_text", "bbox"}]}}.
+# Version 2 encrypts one compressed blob per page: {"version": 2, "pages": {page: blob}}.
+METADATA_VERSION = int(os.environ.get("METADATA_VERSION", 1))
+SUPPORTED_METADATA_VERSIONS = (1, 2)
+# Most of a page blob is float32 bboxes, which barely compress past level 1.
+METADATA_COMPRESS_LEVEL = int(os.environ.get("METADATA_COMPRESS_LEVEL", 1))
+
+_COUNT = struct.Struct("<I")
+
+
+def _pack_page(items: Sequence[Tuple[Sequence[float], str]]) -> bytes:
+    """count, then count float32 bboxes, then count uint32 text lengths, then the UTF-8 texts."""
+    texts = [text.encode('utf-8') for _, text in items]
+    count = len(items)
+    return b"".join((
+        _COUNT.pack(count),
+        struct.pack(f"<{4 * count}f", *(coord for bbox, _ in items for coord in bbox)),
+        struct.pack(f"<{count}I", *(len(text) for text in texts)),
+        *texts,
+    ))
+
+
+def _unpack_page(data: bytes) -> List[Tuple[List[float], str]]:
+    (count,) = _COUNT.unpack_from(data, 0)
+    offset = _COUNT.size
+    coords = struct.unpack_from(f"<{4 * count}f", data, offset)
+    offset += 16 * count
+    lengths = struct.unpack_from(f"<{count}I", data, offset)
+    offset += 4 * count
+    items = []
+    for i, length in enumerate(lengths):
+        items.append((list(coords[4 * i:4 * i + 4]), data[offset:offset + length].decode('utf-8')))
+        offset += length
+    return items
+
+
+def _page_aad(page_num: Any) -> bytes:
+    """Binds each blob to its page number, so blobs cannot be moved between pages."""
+    return f"page:{page_num}".encode('utf-8')
+
+
+class MetadataWriter:
+    """
+    Collects the restorable PII of one document, page by page, and encrypts it
+    in the requested metadata version. Version 2 uses a single AESGCM instance
+    for the whole document and one nonce per page instead of one per item.
+    """
+
+    def __init__(self, key: bytes, version: int = METADATA_VERSION):
+        if version not in SUPPORTED_METADATA_VERSIONS:
+            raise ValueError(f"Unsupported metadata version: {version}")
+        self.key = key
+        self.version = version
+        self.aesgcm = AESGCM(key) if version == 2 else None
+        self.pages: Dict[str, Any] = {}
+
+    def add_page(self, page_num: int, items: Sequence[Tuple[Sequence[float], str]]):
+        """items are (bbox, plaintext) pairs; pages without items are left out."""
+        if not items:
+            return
+        if self.version == 1:
+            self.pages[str(page_num)] = [
+                {"encrypted_text": encrypt_text(self.key, text).decode('utf-8'), "bbox": list(bbox)}
+                for bbox, text in items
+            ]
+            return
+        nonce = os.urandom(NONCE_SIZE)
+        ciphertext = self.aesgcm.encrypt(nonce, zlib.compress(_pack_page(items), METADATA_COMPRESS_LEVEL), _page_aad(page_num))
+        self.pages[str(page_num)] = urlsafe_b64encode(nonce + ciphertext).decode('utf-8')
+
+    def result(self) -> Dict[str, Any]:
+        if self.version == 1:
+            return {"pages": self.pages}
+        return {"version": 2, "pages": self.pages}
+
+
+def _metadata_version(encrypted_metadata: Dict[str, Any]) -> int:
+    version = encrypted_metadata.get("version", 1)
+    if version not in SUPPORTED_METADATA_VERSIONS:
+        raise ValueError(f"Unsupported metadata version: {version}")
+    return version
+
+
+def _decrypt_page(aesgcm: AESGCM, page_num: Any, blob: str) -> List[Tuple[List[float], str]]:
+    payload = urlsafe_b64decode(blob)
+    plaintext = aesgcm.decrypt(payload[:NONCE_SIZE], payload[NONCE_SIZE:], _page_aad(page_num))
+    return _unpack_page(zlib.decompress(plaintext))
+
+
+def read_metadata(key: bytes, encrypted_metadata: Dict[str, Any]) -> Iterator[Tuple[int, List[float], str]]:
+    """
+    Decrypts metadata of any supported version, yielding (page_num, bbox, text).
+    Items (v1) or pages (v2) that cannot be decrypted are skipped with a warning.
+    """
+    version = _metadata_version(encrypted_metadata)
+
+    if version == 1:
+        for page_num, pii_items in encrypted_metadata.get("pages", {}).items():
+            for item in pii_items:
+                try:
+                    yield int(page_num), item["bbox"], decrypt_text(key, item["encrypted_text"].encode('utf-8'))
+                except ValueError:
+                    print(f"Warning: Could not decrypt an item on page {page_num}.")
+        return
+
+    aesgcm = AESGCM(key)
+    for page_num, blob in encrypted_metadata.get("pages", {}).items():
+        try:
+            items = _decrypt_page(aesgcm, page_num, blob)
+        except Exception as e:
+            print(f"Warning: Could not decrypt page {page_num}: {e}")
+            continue
+        for bbox, text in items:
+            yield int(page_num), bbox, text
+
+
+def check_metadata_key(key: bytes, encrypted_metadata: Dict[str, Any]):
+    """Raises ValueError unless key decrypts the first item (v1) or page (v2) of the metadata."""
+    version = _metadata_version(encrypted_metadata)
+    pages = encrypted_metadata.get("pages", {})
+    for page_num, page in pages.items():
+        try:
+            if version == 1:
+                decrypt_text(key, page[0]["encrypted_text"].encode('utf-8'))
+            else:
+                _decrypt_page(AESGCM(key), page_num, page)
+        except Exception:
+            raise ValueError("The key does not decrypt this metadata.")
+        return
+
+
+def merge_metadata(key: bytes, encrypted_metadata: Dict[str, Any],
+                   new_pages: Mapping[int, Sequence[Tuple[Sequence[float], str]]]) -> Dict[str, Any]:
+    """
+    Adds (bbox, plaintext) items to existing metadata, keeping its version and key.
+    Only pages that gain items are touched: v1 items are appended, and v2 pages are
+    decrypted and encrypted again with the new items; every other page is copied as is.
+    Raises ValueError if an existing page that gains items cannot be decrypted.
+    """
+    version = _metadata_version(encrypted_metadata)
+    writer = MetadataWriter(key, version)
+    pages = dict(encrypted_metadata.get("pages", {}))
+    for page_num, items in new_pages.items():
+        if not items:
+            continue
+        existing = pages.get(str(page_num))
+        if existing is None:
+            writer.add_page(page_num, items)
+        elif version == 1:
+            writer.add_page(page_num, items)
+            writer.pages[str(page_num)] = existing + writer.pages[str(page_num)]
+        else:
+            try:
+                existing_items = _decrypt_page(writer.aesgcm, page_num, existing)
+            except Exception as e:
+                raise ValueError(f"Could not decrypt page {page_num}: {e}")
+            writer.add_page(page_num, existing_items + list(items))
+        pages[str(page_num)] = writer.pages[str(page_num)]
+    return {"pages": pages} if version == 1 else {"version": 2, "pages": pages}
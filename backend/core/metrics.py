@@ -0,0 +1,237 @@
+import os
+import time
+import cProfile
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from prometheus_client import CollectorRegistry, Counter as PrometheusCounter, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+# Per-request profiling is switched on by an X-Profile header ("cprofile" or
+# "pyinstrument"), but only when enabled here, as profiles reveal code paths and
+# slow the request down.
+PROFILE_REQUESTS = os.environ.get("PROFILE_REQUESTS", "0") == "1"
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILERS = ("cprofile", "pyinstrument")
+
+REGISTRY = CollectorRegistry()
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 50000, 100000)
+
+HISTOGRAMS = {
+    "stage_duration": Histogram(
+        "redact_stage_duration_seconds", "Time spent in one stage while processing a document.",
+        ["engine", "operation", "stage"], registry=REGISTRY, buckets=DURATION_BUCKETS),
+    "document_duration": Histogram(
+        "redact_document_duration_seconds", "Total time to process or unredact one document.",
+        ["engine", "operation"], registry=REGISTRY, buckets=DURATION_BUCKETS),
+    "document_pages": Histogram(
+        "redact_document_pages", "Pages per processed document.",
+        ["engine"], registry=REGISTRY, buckets=COUNT_BUCKETS),
+    "document_words": Histogram(
+        "redact_document_words", "Extracted words per processed document.",
+        ["engine"], registry=REGISTRY, buckets=COUNT_BUCKETS),
+    "document_detections": Histogram(
+        "redact_document_detections", "PII redacted per processed document, by label (OTHER for categories outside the known labels).",
+        ["engine", "label"], registry=REGISTRY, buckets=COUNT_BUCKETS),
+    "http_duration": Histogram(
+        "redact_http_request_duration_seconds", "HTTP request latency.",
+        ["method", "route", "status"], registry=REGISTRY, buckets=DURATION_BUCKETS),
+}
+
+COUNTERS = {
+    "detection_cache": PrometheusCounter(
+        "redact_detection_cache_events", "Detection cache hits, disk hits, misses and evictions.",
+        ["event"], registry=REGISTRY),
+}
+
+# (histogram or counter, labels, value)
+Sample = Tuple[str, Dict[str, str], float]
+
+# Observations made inside run_instrumented are collected here and recorded by
+# the caller instead, so samples taken in pool workers end up in the API
+# process's registry and on its /metrics endpoint.
+_collector: ContextVar[Optional[List[Sample]]] = ContextVar("metrics_collector", default=None)
+_timer: ContextVar[Optional["DocumentTimer"]] = ContextVar("document_timer", default=None)
+
+
+def _record(name: str, labels: Dict[str, str], value: float):
+    if name in COUNTERS:
+        COUNTERS[name].labels(**labels).inc(value)
+    else:
+        HISTOGRAMS[name].labels(**labels).observe(value)
+
+
+def observe(histogram: str, value: float, **labels: str):
+    samples = _collector.get()
+    if samples is not None:
+        samples.append((histogram, labels, value))
+    else:
+        _record(histogram, labels, value)
+
+
+def increment(counter: str, value: float = 1, **labels: str):
+    """Like observe(), for the counters in COUNTERS."""
+    observe(counter, value, **labels)
+
+
+def record(samples: Iterable[Sample]):
+    for name, labels, value in samples:
+        _record(name, labels, value)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+class DocumentTimer:
+    """
+    Times the stages of one document. Stages nest, and time is exclusive: while
+    an inner stage runs, the enclosing one is paused, so e.g. extraction pulled
+    lazily by the detector is not also counted as detection time.
+    """
+
+    def __init__(self, engine: str, operation: str):
+        self.engine = engine
+        self.operation = operation
+        self.durations: Dict[str, float] = Counter()
+        self.detections: Dict[str, int] = Counter()
+        self.pages = 0
+        self.words = 0
+        self._stack: List[Tuple[str, float]] = []
+        self._start = time.perf_counter()
+
+    def push(self, name: str):
+        now = time.perf_counter()
+        if self._stack:
+            parent, started = self._stack[-1]
+            self.durations[parent] += now - started
+        self._stack.append((name, now))
+
+    def pop(self):
+        now = time.perf_counter()
+        name, started = self._stack.pop()
+        self.durations[name] += now - started
+        if self._stack:
+            self._stack[-1] = (self._stack[-1][0], now)
+
+    def finish(self, failed: bool = False):
+        for name, seconds in self.durations.items():
+            observe("stage_duration", seconds, engine=self.engine, operation=self.operation, stage=name)
+        observe("document_duration", time.perf_counter() - self._start, engine=self.engine,
+                operation=f"{self.operation}_failed" if failed else self.operation)
+        if self.operation == "process" and not failed:
+            observe("document_pages", self.pages, engine=self.engine)
+            observe("document_words", self.words, engine=self.engine)
+            for label, count in self.detections.items():
+                observe("document_detections", count, engine=self.engine, label=label)
+
+
+@contextmanager
+def stage(name: str):
+    """Times a block as a stage of the document being processed, if any."""
+    timer = _timer.get()
+    if timer is None:
+        yield
+        return
+    timer.push(name)
+    try:
+        yield
+    finally:
+        timer.pop()
+
+
+def timed_iter(name: str, iterable: Iterable[Any]) -> Iterator[Any]:
+    """Yields from iterable, timing each step (the work done to produce an item) as a stage."""
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def count_pages(pages: int = 0, words: int = 0):
+    timer = _timer.get()
+    if timer is not None:
+        timer.pages += pages
+        timer.words += words
+
+
+def count_detections(labels: Iterable[str]):
+    timer = _timer.get()
+    if timer is not None:
+        timer.detections.update(labels)
+
+
+def instrumented(engine: str, operation: str):
+    """Decorator that times every call as one document, with its stages, pages, words and detections."""
+    def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            timer = DocumentTimer(engine, operation)
+            token = _timer.set(timer)
+            failed = True
+            try:
+                result = fn(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                _timer.reset(token)
+                timer.finish(failed)
+        return wrapper
+    return decorator
+
+
+def _profile_path(profiler: str) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    extension = "prof" if profiler == "cprofile" else "html"
+    return os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{time.perf_counter_ns()}.{extension}")
+
+
+def run_instrumented(fn: Callable[..., Any], args: Tuple[Any, ...], profiler: Optional[str] = None) -> Tuple[Any, List[Sample], Optional[str]]:
+    """
+    Runs fn(*args), usually in a pool worker, and returns (result, samples, profile_path).
+    samples are the metrics observed during the call, for the caller to record();
+    if fn raises, they are attached to the exception as metrics_samples.
+    With profiler set, the call is profiled and the profile written under PROFILE_DIR.
+    """
+    samples: List[Sample] = []
+    token = _collector.set(samples)
+    try:
+        if profiler == "pyinstrument" and Profiler is None:
+            print("Warning: pyinstrument is not installed, profiling with cProfile instead.")
+            profiler = "cprofile"
+        if profiler == "cprofile":
+            profile = cProfile.Profile()
+            result = profile.runcall(fn, *args)
+            profile_path = _profile_path(profiler)
+            profile.dump_stats(profile_path)
+        elif profiler == "pyinstrument":
+            profile = Profiler()
+            profile.start()
+            try:
+                result = fn(*args)
+            finally:
+                profile.stop()
+            profile_path = _profile_path(profiler)
+            with open(profile_path, "w") as f:
+                f.write(profile.output_html())
+        else:
+            result, profile_path = fn(*args), None
+    except Exception as e:
+        # Exceptions are pickled with their __dict__, so the samples survive the trip back from a worker.
+        e.metrics_samples = samples
+        raise
+    finally:
+        _collector.reset(token)
+    return result, samples, profile_path
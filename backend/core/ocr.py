@@ -0,0 +1,127 @@
+import os
+import queue
+from abc import ABC, abstractmethod
+from typing import Any, List, Optional
+
+import pytesseract
+from PIL import Image
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+# "auto" uses tesserocr when it is installed and its language data is found, else pytesseract.
+OCR_BACKEND = os.environ.get("OCR_BACKEND", "auto")
+OCR_LANG = os.environ.get("OCR_LANG", "eng")
+OCR_MIN_CONFIDENCE = 60
+TESSDATA_PATHS = [
+    os.environ.get("TESSDATA_PREFIX", ""),
+    "/usr/share/tesseract-ocr/5/tessdata",
+    "/usr/share/tesseract-ocr/4.00/tessdata",
+    "/usr/share/tessdata",
+]
+
+
+def find_tessdata(lang: str = OCR_LANG) -> Optional[str]:
+    for path in TESSDATA_PATHS:
+        if path and os.path.exists(os.path.join(path, f"{lang}.traineddata")):
+            return path
+    return None
+
+
+class OCRBackend(ABC):
+    """Turns an in-memory image into [x0, y0, x1, y1, word] pixel boxes for words with confidence > 60."""
+
+    name = "base"
+
+    @abstractmethod
+    def ocr(self, image: Image.Image) -> List[List[Any]]:
+        ...
+
+    def warm(self):
+        """Loads whatever the backend needs up front, so the first request does not pay for it."""
+
+
+class PytesseractBackend(OCRBackend):
+    """Runs the tesseract CLI once per image: a process spawn and model load every call."""
+
+    name = "pytesseract"
+
+    def ocr(self, image):
+        data = pytesseract.image_to_data(image, lang=OCR_LANG, output_type=pytesseract.Output.DICT)
+        words = []
+        n_boxes = len(data['level'])
+        for i in range(n_boxes):
+            if int(data['conf'][i]) > OCR_MIN_CONFIDENCE:
+                (x, y, w, h) = (data['left'][i], data['top'][i], data['width'][i], data['height'][i])
+                word = data['text'][i]
+                if word.strip():
+                    words.append([x, y, x + w, y + h, word])
+        return words
+
+    def warm(self):
+        pytesseract.get_tesseract_version()
+
+
+class TesserocrBackend(OCRBackend):
+    """
+    Uses the Tesseract C API through tesserocr. Engines are kept in a pool and
+    reused across calls and threads, so the model is loaded once per engine
+    instead of once per image. tesserocr releases the GIL while recognizing,
+    so several threads can OCR at the same time.
+    """
+
+    name = "tesserocr"
+
+    def __init__(self, path: Optional[str] = None, lang: str = OCR_LANG):
+        self.path = path or find_tessdata(lang)
+        self.lang = lang
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return tesserocr.PyTessBaseAPI(path=self.path, lang=self.lang)
+
+    def ocr(self, image):
+        api = self._acquire()
+        try:
+            api.SetImage(image)
+            api.Recognize()
+            level = tesserocr.RIL.WORD
+            words = []
+            for result in tesserocr.iterate_level(api.GetIterator(), level):
+                word = result.GetUTF8Text(level)
+                if word and word.strip() and result.Confidence(level) > OCR_MIN_CONFIDENCE:
+                    x0, y0, x1, y1 = result.BoundingBox(level)
+                    words.append([x0, y0, x1, y1, word])
+            return words
+        finally:
+            api.Clear()
+            self._idle.put(api)
+
+    def warm(self):
+        self._idle.put(self._acquire())
+
+
+_backend: Optional[OCRBackend] = None
+
+
+def make_ocr_backend(kind: str = OCR_BACKEND) -> OCRBackend:
+    if kind == "tesserocr" or (kind == "auto" and tesserocr is not None and find_tessdata()):
+        if tesserocr is None:
+            raise ValueError("OCR_BACKEND=tesserocr but tesserocr is not installed.")
+        return TesserocrBackend()
+    if kind in ("auto", "pytesseract"):
+        return PytesseractBackend()
+    raise ValueError(f"Unknown OCR backend: {kind}")
+
+
+def get_ocr_backend() -> OCRBackend:
+    """Returns the process-wide OCR backend, creating it on first use."""
+    global _backend
+    if _backend is None:
+        _backend = make_ocr_backend()
+    return _backend
@@ -0,0 +1,137 @@
+import re
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+
+class PiiPattern(NamedTuple):
+    """
+    A regex detector. If the regex has a (?P<value>...) group, only that part is
+    reported as PII. validator, if set, gets the reported text and can reject it.
+    """
+    label: str
+    regex: str
+    validator: Optional[Callable[[str], bool]] = None
+
+    @property
+    def compiled(self) -> "re.Pattern":
+        return _compile(self.regex)
+
+
+@lru_cache(maxsize=None)
+def _compile(regex: str) -> "re.Pattern":
+    return re.compile(regex)
+
+
+def luhn_valid(value: str) -> bool:
+    """Luhn checksum used by payment card numbers."""
+    digits = [int(c) for c in value if c.isdigit()]
+    if not 13 <= len(digits) <= 19:
+        return False
+    total = 0
+    for i, digit in enumerate(reversed(digits)):
+        if i % 2 == 1:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return total % 10 == 0
+
+
+def iban_valid(value: str) -> bool:
+    """ISO 13616 mod-97 check."""
+    iban = value.replace(" ", "").upper()
+    if not 15 <= len(iban) <= 34:
+        return False
+    rearranged = iban[4:] + iban[:4]
+    return int("".join(str(int(c, 36)) for c in rearranged)) % 97 == 1
+
+
+# Matches of different patterns may overlap; each pattern reports its own.
+# Matches only start at a token boundary (not right after a letter or digit),
+# which lets the scanner skip the inside of words instead of trying every
+# alternative at every character.
+PATTERN_REGISTRY: Dict[str, PiiPattern] = {}
+
+
+def register_pattern(label: str, regex: str, validator: Optional[Callable[[str], bool]] = None):
+    """Adds or replaces a pattern; label must be a valid Python identifier."""
+    PATTERN_REGISTRY[label] = PiiPattern(label, regex, validator)
+    compile_scanner.cache_clear()
+
+
+class RegexScanner:
+    """
+    Scans text once with all active patterns compiled into a single alternation
+    of named groups, instead of one finditer pass per pattern.
+    """
+
+    BOUNDARY = r"(?<![A-Za-z0-9])"
+
+    def __init__(self, patterns: Iterable[PiiPattern]):
+        self.patterns = list(patterns)
+        self.index = {p.label: i for i, p in enumerate(self.patterns)}
+        self.combined = re.compile(self.BOUNDARY + "(?:" + "|".join(
+            f"(?P<{p.label}>{p.regex.replace('(?P<value>', f'(?P<{p.label}__value>')})" for p in self.patterns
+        ) + ")") if self.patterns else None
+
+    def _accept(self, pattern: PiiPattern, match: "re.Match", value_group: str) -> Optional[Tuple[int, int]]:
+        if value_group in match.re.groupindex and match.start(value_group) != -1:
+            start, end = match.span(value_group)
+        else:
+            start, end = match.span(pattern.label) if pattern.label in match.re.groupindex else match.span()
+        if pattern.validator and not pattern.validator(match.string[start:end]):
+            return None
+        return start, end
+
+    def scan(self, text: str) -> List[Dict[str, int]]:
+        """
+        Finds every pattern's matches, as one search per pattern would that starts
+        each match at a token boundary (BOUNDARY). Unlike finditer, a match the
+        validator rejects does not cover its text: the search resumes at the next
+        position, so e.g. a card number right after other digits is still found once
+        the longer run fails its Luhn check. Matches of different labels may overlap,
+        so a broad pattern never hides a more sensitive one that a lower severity
+        still has to redact. The combined regex finds the positions where some
+        pattern matches, and the first pattern that matches there; only the patterns
+        after it are tried on their own, unless their previous accepted match
+        already covers the position.
+        """
+        if self.combined is None:
+            return []
+        found, pos = [], 0
+        resume = [0] * len(self.patterns)
+        while True:
+            match = self.combined.search(text, pos)
+            if match is None:
+                return found
+            start, first = match.start(), self.index[match.lastgroup]
+            for i in range(first, len(self.patterns)):
+                pattern = self.patterns[i]
+                if resume[i] > start:
+                    continue
+                if i == first:
+                    pattern_match, value_group = match, f"{pattern.label}__value"
+                else:
+                    pattern_match, value_group = pattern.compiled.match(text, start), "value"
+                span = pattern_match and self._accept(pattern, pattern_match, value_group)
+                if span:
+                    found.append({"start": span[0], "end": span[1], "label": pattern.label})
+                    resume[i] = max(pattern_match.end(), start + 1)
+            pos = start + 1
+
+
+@lru_cache(maxsize=None)
+def compile_scanner(labels: Tuple[str, ...]) -> RegexScanner:
+    """Returns the scanner for the registered patterns among labels, cached per label set."""
+    return RegexScanner(p for label, p in PATTERN_REGISTRY.items() if label in labels)
+
+
+register_pattern("CREDIT_CARD", r"\b(?:\d[ -]?){12,18}\d\b", luhn_valid)
+register_pattern("SSN", r"\b(?!000|666|9\d\d)\d{3}-(?!00)\d{2}-(?!0000)\d{4}\b")
+register_pattern("IBAN", r"\b[A-Z]{2}\d{2}(?: ?[A-Z0-9]{4}){2,7}(?: ?[A-Z0-9]{1,4})?\b", iban_valid)
+register_pattern("PASSPORT", r"(?i:passport)(?:\s*(?i:no\.?|number|#))?\s*[:#]?\s*(?P<value>[A-Z0-9]{6,9})\b")
+register_pattern("EMAIL", r"[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+")
+register_pattern("PHONE", r"\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}")
+register_pattern("PNR", r"\b\d{10}\b")
+register_pattern("TRANSACTION_ID", r"Transaction ID:\s*(?P<value>\d+)")
+register_pattern("INVOICE_NUMBER", r"Invoice Number:\s*(?P<value>[A-Z0-9]+)")
@@ -1,123 +1,269 @@
 import os
 import fitz  
-from PIL import Image, ImageDraw
-from typing import List, Tuple
+from PIL import Image, ImageDraw, ImageFont, TiffImagePlugin
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-def redact_pdf(file_path: str, redaction_boxes: List[Tuple[int, fitz.Rect]], output_path: str):
+from .documents import Source, Target, iter_frames, open_pdf, open_image, save_image
+
+MERGE_TOLERANCE = 1.0
+# PyMuPDF's add_redact_annot slows down as annotations pile up on a page, so very
+# dense pages are applied in a few chunks instead of all at once.
+REDACTIONS_PER_APPLY = 50
+
+FONT_PATHS = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/System/Library/Fonts/SFNSDisplay.ttf",
+    "C:/Windows/Fonts/Arial.ttf",
+]
+FONT_CACHE_SIZE = int(os.environ.get("FONT_CACHE_SIZE", 1024))
+# Text widths are measured once at this size and scaled, as glyph advances scale linearly.
+FONT_MEASURE_SIZE = 100
+PDF_FONT = "helv"
+PDF_MIN_FONT_SIZE = 4
+IMAGE_MIN_FONT_SIZE = 8
+# Restored text fills this share of the box height, unless it has to shrink to fit the width.
+TEXT_HEIGHT_RATIO = 0.75
+TEXT_PADDING = 1
+# Image modes that boxes are drawn on directly; pages in other modes are converted to RGB first.
+DRAWABLE_MODES = ("1", "L", "RGB", "RGBA")
+
+def _same_band(a: fitz.Rect, b: fitz.Rect, tolerance: float) -> bool:
+    """True if a and b share a row or a column, so their union adds no uncovered area."""
+    same_row = abs(a.y0 - b.y0) <= tolerance and abs(a.y1 - b.y1) <= tolerance
+    same_col = abs(a.x0 - b.x0) <= tolerance and abs(a.x1 - b.x1) <= tolerance
+    return same_row or same_col
+
+def _touches(a: fitz.Rect, b: fitz.Rect, tolerance: float) -> bool:
+    return (a.x0 - tolerance <= b.x1 and b.x0 - tolerance <= a.x1 and
+            a.y0 - tolerance <= b.y1 and b.y0 - tolerance <= a.y1)
+
+def merge_rects(rects: List[fitz.Rect], tolerance: float = MERGE_TOLERANCE) -> List[fitz.Rect]:
     """
-    Applies solid, opaque, black redaction boxes to a PDF.
-    This method guarantees 100% coverage of the redacted area.
+    Merges overlapping or adjacent rects into fewer, larger ones.
+    Two rects are only merged when one contains the other or they sit on the same
+    row/column, so the merged area never covers more than the original rects did.
     """
-    doc = fitz.open(file_path)
+    merged = sorted((fitz.Rect(r) for r in rects), key=lambda r: (r.y0, r.x0))
+    changed = True
+    while changed:
+        changed = False
+        result: List[fitz.Rect] = []
+        for rect in merged:
+            for existing in result:
+                if not _touches(existing, rect, tolerance):
+                    continue
+                if existing.contains(rect):
+                    break
+                if rect.contains(existing) or _same_band(existing, rect, tolerance):
+                    existing.include_rect(rect)
+                    changed = True
+                    break
+            else:
+                result.append(rect)
+        merged = result
+    return merged
+
+def group_boxes_by_page(redaction_boxes: List[Tuple[int, fitz.Rect]]) -> Dict[int, List[fitz.Rect]]:
+    """Groups (page_num, bbox) pairs into {page_num: [bbox, ...]}."""
+    boxes_by_page: Dict[int, List[fitz.Rect]] = defaultdict(list)
     for page_num, bbox in redaction_boxes:
-        page = doc[page_num]
+        boxes_by_page[page_num].append(fitz.Rect(bbox))
+    return boxes_by_page
 
-        page.add_redact_annot(
-            bbox,
-            fill=(0, 0, 0)  
-        )
+def redact_page(page: fitz.Page, bboxes: List[fitz.Rect]):
+    """
+    Merges a page's boxes and applies them as solid black redactions, rewriting
+    the page once per REDACTIONS_PER_APPLY boxes instead of once per box.
+    """
+    merged = merge_rects(bboxes)
+    for start in range(0, len(merged), REDACTIONS_PER_APPLY):
+        for bbox in merged[start:start + REDACTIONS_PER_APPLY]:
+            page.add_redact_annot(
+                bbox,
+                fill=(0, 0, 0)
+            )
         page.apply_redactions()
-    doc.save(output_path, garbage=4, clean=True)
-    doc.close()
 
-def redact_image(file_path: str, redaction_boxes: List[fitz.Rect], output_path: str):
+def save_redacted_pdf(doc: fitz.Document, output: Target):
+    doc.save(output, garbage=4, clean=True)
+
+def save_reredacted_pdf(doc: fitz.Document, output: Target):
+    """
+    Saves a PDF already saved by save_redacted_pdf, after redacting some of its pages again.
+    garbage=1 drops the content the new redactions replaced, while skipping the
+    cleanup and deduplication of every page, which the first save already did.
+    An incremental save would be cheaper still, but it appends changes to the file
+    and leaves the previous revision, with the text just redacted, in place.
+    """
+    doc.save(output, garbage=1)
+
+def redact_pdf(source: Source, redaction_boxes: List[Tuple[int, fitz.Rect]], output: Target):
+    """
+    Applies solid, opaque, black redaction boxes to a PDF.
+    This method guarantees 100% coverage of the redacted area.
+    Boxes are grouped and merged per page before they are applied.
+    """
+    doc = open_pdf(source)
+    try:
+        for page_num, bboxes in group_boxes_by_page(redaction_boxes).items():
+            redact_page(doc[page_num], bboxes)
+        save_redacted_pdf(doc, output)
+    finally:
+        doc.close()
+
+def _save_options(original: Image.Image, page: Image.Image) -> Dict[str, Any]:
+    """Keeps the resolution and TIFF compression of the original page, where the edited page's mode allows."""
+    options = {}
+    if "dpi" in original.info:
+        options["dpi"] = original.info["dpi"]
+    compression = original.info.get("compression")
+    if original.format == "TIFF" and compression not in (None, "raw") and (page is original or not compression.startswith("group")):
+        options["compression"] = compression
+    return options
+
+def _edit_page(page_num: int, frame: Image.Image, edit: Callable[[int, ImageDraw.ImageDraw], None]) -> Image.Image:
+    page = frame if frame.mode in DRAWABLE_MODES else frame.convert("RGB")
+    edit(page_num, ImageDraw.Draw(page))
+    return page
+
+def edit_image(source: Source, output: Target, edit: Callable[[int, ImageDraw.ImageDraw], None]):
+    """
+    Calls edit(page_num, draw) for each page of an image (each frame of a TIFF) and
+    writes the result to output. Pages are drawn on in place, in their own mode where
+    possible, and a multi-page TIFF is written one page at a time, so only one
+    decoded full-resolution page is held in memory.
+    """
+    with open_image(source) as image:
+        image_format = image.format
+        if image_format != "TIFF" or getattr(image, "n_frames", 1) == 1:
+            page = _edit_page(0, image, edit)
+            save_image(page, output, image_format, **_save_options(image, page))
+            return
+        with TiffImagePlugin.AppendingTiffWriter(output, new=True) as tiff:
+            for page_num, frame in iter_frames(image):
+                page = _edit_page(page_num, frame, edit)
+                page.save(tiff, format="TIFF", **_save_options(frame, page))
+                tiff.newFrame()
+
+def redact_image(source: Source, redaction_boxes: List[Tuple[int, fitz.Rect]], output: Target):
     """
     Draws solid, opaque, black boxes over specified areas in an image.
+    redaction_boxes are (page_num, bbox) pairs; page_num is the frame of a multi-page TIFF, else 0.
     This method guarantees 100% coverage of the redacted area.
     """
-    image = Image.open(file_path).convert("RGB")
-    draw = ImageDraw.Draw(image)
+    boxes_by_page = group_boxes_by_page(redaction_boxes)
+
+    def draw_boxes(page_num: int, draw: ImageDraw.ImageDraw):
+        for bbox in boxes_by_page.get(page_num, []):
+            draw.rectangle((bbox.x0, bbox.y0, bbox.x1, bbox.y1), fill="black")
 
-    for bbox in redaction_boxes:
-        box_coords = (bbox.x0, bbox.y0, bbox.x1, bbox.y1)
-        draw.rectangle(box_coords, fill="black")
-            
-    image.save(output_path)
+    edit_image(source, output, draw_boxes)
 
 
-def write_on_pdf(file_path: str, restored_data: list, output_path: str, password: str = None):
+def fit_font_size(length_per_point: float, box_width: float, box_height: float, min_size: float) -> float:
+    """
+    Largest font size at which text fits the box: TEXT_HEIGHT_RATIO of its height,
+    shrunk to the box width (less padding) for long text, but never below min_size.
+    length_per_point is the rendered text width at a font size of 1.
+    """
+    size = box_height * TEXT_HEIGHT_RATIO
+    available = box_width - 2 * TEXT_PADDING
+    if length_per_point * size > available:
+        size = available / length_per_point
+    return max(size, min_size)
+
+# Widths are cached per character, never per text, so restored PII is not kept in memory.
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def _pdf_char_width(char: str) -> float:
+    return fitz.get_text_length(char, fontname=PDF_FONT, fontsize=1)
+
+def _pdf_length_per_point(text: str) -> float:
+    return sum(map(_pdf_char_width, text)) or 1.0
+
+def group_restored_by_page(restored_data: list) -> Dict[int, List[Tuple[fitz.Rect, str]]]:
+    """Groups (page_num, bbox, text) tuples into {page_num: [(bbox, text), ...]}."""
+    by_page: Dict[int, List[Tuple[fitz.Rect, str]]] = defaultdict(list)
+    for page_num, bbox_coords, text in restored_data:
+        by_page[page_num].append((fitz.Rect(bbox_coords), text))
+    return by_page
+
+def write_on_pdf(source: Source, restored_data: list, output: Target, password: str = None):
     """
     Writes decrypted text back onto a redacted PDF.
     restored_data is a list of tuples: (page_num, bbox, text).
+    Each page gets one Shape holding all its white boxes and text, so its content
+    stream is rewritten once instead of twice per item.
     """
-    doc = fitz.open(file_path)
-    
-    for page_num, bbox_coords, text in restored_data:
-        page = doc[page_num]
-        bbox = fitz.Rect(bbox_coords)
-        page.draw_rect(bbox, color=(1, 1, 1), fill=(1, 1, 1))
-        bbox_height = bbox.height
-        font_size = int(bbox_height * 0.6)
-        font_size = max(font_size, 6)
-        page.insert_text(
-            bbox.bl + (2, -2),
-            text,
-            fontsize=font_size,
-            fontname="helv",
-            color=(0, 0, 0),
-        )
+    doc = open_pdf(source)
+
+    for page_num, items in group_restored_by_page(restored_data).items():
+        shape = doc[page_num].new_shape()
+        for bbox, _ in items:
+            shape.draw_rect(bbox)
+        shape.finish(color=(1, 1, 1), fill=(1, 1, 1))
+        for bbox, text in items:
+            font_size = fit_font_size(_pdf_length_per_point(text), bbox.width, bbox.height, PDF_MIN_FONT_SIZE)
+            # Baseline placed so the cap height is centred vertically in the box.
+            baseline = bbox.y0 + (bbox.height + font_size * 0.7) / 2
+            shape.insert_text(
+                (bbox.x0 + TEXT_PADDING, baseline),
+                text,
+                fontsize=font_size,
+                fontname=PDF_FONT,
+                color=(0, 0, 0),
+            )
+        shape.commit()
     
     if password:
-        doc.save(output_path, encryption=fitz.PDF_ENCRYPT_AES_256, owner_pw=password, user_pw=password, permissions=fitz.PDF_PERM_ACCESSIBILITY)
+        doc.save(output, encryption=fitz.PDF_ENCRYPT_AES_256, owner_pw=password, user_pw=password, permissions=fitz.PDF_PERM_ACCESSIBILITY)
     else:
-        doc.save(output_path)
+        doc.save(output)
         
     doc.close()
 
-def write_on_image(file_path: str, restored_data: list, output_path: str):
+@lru_cache(maxsize=None)
+def find_font_path() -> Optional[str]:
+    """First of FONT_PATHS that exists, looked up once per process."""
+    for font_path in FONT_PATHS:
+        if os.path.exists(font_path):
+            return font_path
+    return None
+
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def load_font(font_path: Optional[str], size: int) -> ImageFont.FreeTypeFont:
+    """Loaded fonts, cached by (path, size); Pillow's bundled font is used when font_path is None."""
+    if font_path:
+        try:
+            return ImageFont.truetype(font_path, size)
+        except OSError as e:
+            print(f"Warning: Could not load font {font_path}: {e}")
+    return ImageFont.load_default(size)
+
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def _image_char_width(font_path: Optional[str], char: str) -> float:
+    return load_font(font_path, FONT_MEASURE_SIZE).getlength(char) / FONT_MEASURE_SIZE
+
+def _image_length_per_point(font_path: Optional[str], text: str) -> float:
+    """Sum of the character advances; kerning is ignored, which only matters a little for fitting."""
+    return sum(_image_char_width(font_path, char) for char in text) or 1.0
+
+def write_on_image(source: Source, restored_data: list, output: Target):
     """
     Writes decrypted text back onto a redacted image.
-    restored_data is a list of tuples: (bbox, text).
+    restored_data is a list of tuples: (page_num, bbox, text), as for write_on_pdf.
+    All white boxes are drawn before any text, so neighbouring boxes cannot cover restored text.
     """
-    image = Image.open(file_path).convert("RGB")
-    draw = ImageDraw.Draw(image)
-    
-    try:
-        font_paths = [
-            "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",  
-            "/System/Library/Fonts/SFNSDisplay.ttf",  
-            "C:/Windows/Fonts/Arial.ttf"  
-        ]
-        
-        font = None
-        for font_path in font_paths:
-            if os.path.exists(font_path):
-                font = ImageFont.truetype(font_path, 12)
-                break
-        
-        if font is None:
-            font = ImageFont.load_default()
-    except:
-        font = ImageFont.load_default()
-
-    for bbox_coords, text in restored_data:
-        x0, y0, x1, y1 = bbox_coords
-        box_width = x1 - x0
-        box_height = y1 - y0
-        
-        draw.rectangle(bbox_coords, fill="white")
-        
-        font_size = int(box_height * 0.6)
-        font_size = max(font_size, 8)  
-        
-        try:
-            if hasattr(font, 'path'):
-                current_font = ImageFont.truetype(font.path, font_size)
-            else:
-                current_font = ImageFont.load_default()
-        except:
-            current_font = ImageFont.load_default()
-        
-        try:
-            text_bbox = draw.textbbox((0, 0), text, font=current_font)
-            text_width = text_bbox[2] - text_bbox[0]
-            text_height = text_bbox[3] - text_bbox[1]
-            
-            x_pos = x0 + (box_width - text_width) / 2
-            y_pos = y0 + (box_height - text_height) / 2
-            
-            draw.text((x_pos, y_pos), text, fill="black", font=current_font)
-        except:
-            draw.text((x0 + 2, y0 + 2), text, fill="black", font=current_font)
-    
-    image.save(output_path)
\ No newline at end of file
+    restored_by_page = group_restored_by_page(restored_data)
+    font_path = find_font_path()
+
+    def draw_text(page_num: int, draw: ImageDraw.ImageDraw):
+        items = restored_by_page.get(page_num, [])
+        for bbox, _ in items:
+            draw.rectangle((bbox.x0, bbox.y0, bbox.x1, bbox.y1), fill="white")
+        for bbox, text in items:
+            font_size = int(fit_font_size(_image_length_per_point(font_path, text), bbox.width, bbox.height, IMAGE_MIN_FONT_SIZE))
+            draw.text(((bbox.x0 + bbox.x1) / 2, (bbox.y0 + bbox.y1) / 2), text, fill="black", font=load_font(font_path, font_size), anchor="mm")
+
+    edit_image(source, output, draw_text)
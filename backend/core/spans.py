@@ -0,0 +1,87 @@
+import string
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import fitz
+
+PUNCTUATION = string.punctuation + "“”‘’«»"
+
+
+def union_bbox(words: Sequence[Sequence[Any]], indices: Iterable[int]) -> Tuple[fitz.Rect, str]:
+    """Returns the bbox enclosing the given words and their text joined by spaces."""
+    bbox = fitz.Rect()
+    parts = []
+    for i in indices:
+        bbox.include_rect(fitz.Rect(words[i][:4]))
+        parts.append(words[i][4])
+    return bbox, " ".join(parts)
+
+
+def normalize_token(token: str) -> str:
+    """Case-folds a token and strips surrounding punctuation, e.g. 'Doe,' -> 'doe'."""
+    folded = token.casefold()
+    return folded.strip(PUNCTUATION) or folded
+
+
+class WordSpanIndex:
+    """
+    Maps character spans of a page's text back to its words.
+    The page text is the words joined by single spaces, as passed to the
+    detectors. Word start/end offsets are kept in sorted arrays, so each span
+    is resolved with two binary searches instead of a scan over every word.
+    """
+
+    def __init__(self, words: Sequence[Sequence[Any]]):
+        self.words = words
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        char_offset = 0
+        for word_info in words:
+            self.starts.append(char_offset)
+            char_offset += len(word_info[4])
+            self.ends.append(char_offset)
+            char_offset += 1
+        self.text = " ".join(word_info[4] for word_info in words)
+
+    def word_range(self, start: int, end: int) -> range:
+        """Indices of the words that overlap the [start, end) character span."""
+        first = bisect_right(self.ends, start)
+        last = bisect_left(self.starts, end)
+        return range(first, max(first, last))
+
+    def resolve(self, start: int, end: int) -> Optional[Tuple[fitz.Rect, str]]:
+        """Returns the union bbox and the joined text of the words overlapping the span, or None."""
+        indices = self.word_range(start, end)
+        if not indices:
+            return None
+        return union_bbox(self.words, indices)
+
+
+class TokenIndex:
+    """
+    Finds every occurrence of a token sequence among a page's words.
+    Tokens are compared after normalize_token, and a map from normalized token
+    to its positions means only positions starting with the right token are checked.
+    """
+
+    def __init__(self, words: Sequence[Sequence[Any]]):
+        self.words = words
+        self.tokens = [normalize_token(word_info[4]) for word_info in words]
+        self.positions: Dict[str, List[int]] = defaultdict(list)
+        for i, token in enumerate(self.tokens):
+            self.positions[token].append(i)
+
+    def find_all(self, text: str) -> List[range]:
+        """Word index ranges of every occurrence of text on the page."""
+        needle = [normalize_token(token) for token in text.split()]
+        if not needle:
+            return []
+        return [
+            range(i, i + len(needle))
+            for i in self.positions.get(needle[0], ())
+            if self.tokens[i:i + len(needle)] == needle
+        ]
+
+    def resolve(self, occurrence: range) -> Tuple[fitz.Rect, str]:
+        return union_bbox(self.words, occurrence)
@@ -0,0 +1,157 @@
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, Callable, Optional, Tuple
+
+from .metrics import record, run_instrumented
+from .llm_scheduler import SharedTokenBucket, start_shared_bucket, use_bucket
+
+PROCESS_WORKERS = int(os.environ.get("PROCESS_WORKERS", os.cpu_count() or 1))
+PROCESS_MAX_TASKS_PER_CHILD = int(os.environ.get("PROCESS_MAX_TASKS_PER_CHILD", 50))
+PROCESS_MAX_PENDING = int(os.environ.get("PROCESS_MAX_PENDING", max(PROCESS_WORKERS, 1) * 4))
+PROCESS_WARMUP = os.environ.get("PROCESS_WARMUP", "1") == "1"
+
+
+class PoolBusyError(RuntimeError):
+    """Raised when the pool already has max_pending jobs queued or running."""
+
+
+def warm_worker():
+    """
+    Runs once in every worker process so the first job does not pay for
+    loading the spaCy model, the Gemini client or a Tesseract engine.
+    """
+    from . import engine  # noqa: F401  (configures Gemini)
+    from .identifier_classic import get_nlp
+    from .ocr import get_ocr_backend
+
+    get_nlp()
+
+    try:
+        get_ocr_backend().warm()
+    except Exception as e:
+        print(f"Warning: Tesseract is not available in worker {os.getpid()}: {e}")
+
+
+def init_worker(bucket: SharedTokenBucket, warmup: bool):
+    """Pool worker initializer: LLM requests draw from the pool's shared bucket, then warm_worker if enabled."""
+    use_bucket(bucket)
+    if warmup:
+        warm_worker()
+
+
+class DocumentProcessPool:
+    """
+    Runs CPU-bound document processing in a process pool, off the event loop.
+    With workers=0 jobs run in a thread of the current process instead.
+    """
+
+    def __init__(self, workers: int = PROCESS_WORKERS, max_tasks_per_child: int = PROCESS_MAX_TASKS_PER_CHILD,
+                 max_pending: int = PROCESS_MAX_PENDING, warmup: bool = PROCESS_WARMUP):
+        self.workers = workers
+        self.max_tasks_per_child = max_tasks_per_child or None
+        self.max_pending = max_pending
+        self.warmup = warmup
+        self.pending = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._bucket_manager = None
+        self._bucket: Optional[SharedTokenBucket] = None
+
+    def start(self):
+        if self.workers <= 0 or self._executor is not None:
+            return
+        context = multiprocessing.get_context("spawn")
+        # Kept across restarts, so replaced workers stay within the same LLM rate.
+        if self._bucket_manager is None:
+            self._bucket_manager, self._bucket = start_shared_bucket(context)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=init_worker,
+            initargs=(self._bucket, self.warmup),
+            max_tasks_per_child=self.max_tasks_per_child,
+        )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        if self._bucket_manager is not None:
+            self._bucket_manager.shutdown()
+            self._bucket_manager = self._bucket = None
+
+    def _restart(self, executor: ProcessPoolExecutor):
+        """
+        Replaces a pool that broke because a worker died (e.g. killed for running out
+        of memory). Jobs already in it fail with BrokenProcessPool; later ones get the
+        new pool. Does nothing if executor was already replaced.
+        """
+        if self._executor is not executor:
+            return
+        print("Warning: a worker process died, restarting the process pool.")
+        executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self.start()
+
+    def _submit(self, fn: Callable[..., Any], args: Tuple[Any, ...], profiler: Optional[str]) -> "asyncio.Future[Any]":
+        """
+        Schedules fn(*args) through run_instrumented and returns a future for
+        (result, profile_path). Metrics observed in the worker are recorded here.
+        The slot is reserved immediately, so callers can rely on PoolBusyError
+        being raised here rather than later. Must be called from the event loop.
+        """
+        if self.pending >= self.max_pending:
+            raise PoolBusyError(f"{self.pending} jobs already pending.")
+        call = partial(run_instrumented, fn, args, profiler)
+        executor = self._executor
+        if executor is None:
+            future = asyncio.ensure_future(asyncio.to_thread(call))
+        else:
+            loop = asyncio.get_running_loop()
+            try:
+                future = loop.run_in_executor(executor, call)
+            except BrokenProcessPool:
+                # A worker died while the pool was idle; nothing is in flight to fail.
+                self._restart(executor)
+                executor = self._executor
+                future = loop.run_in_executor(executor, call)
+        self.pending += 1
+        future.add_done_callback(self._release)
+        return asyncio.ensure_future(self._record(future, executor))
+
+    async def _record(self, future: "asyncio.Future[Any]", executor: Optional[ProcessPoolExecutor]) -> Tuple[Any, Optional[str]]:
+        try:
+            result, samples, profile_path = await future
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise
+        except Exception as e:
+            record(getattr(e, "metrics_samples", ()))
+            raise
+        record(samples)
+        return result, profile_path
+
+    def _release(self, _future: "asyncio.Future[Any]"):
+        self.pending -= 1
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> "asyncio.Future[Any]":
+        """Schedules fn(*args) in the pool and returns a future for its result. Raises PoolBusyError when the queue is full."""
+        future = self._submit(fn, args, None)
+        return asyncio.ensure_future(self._result(future))
+
+    @staticmethod
+    async def _result(future: "asyncio.Future[Any]") -> Any:
+        result, _ = await future
+        return result
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Runs fn(*args) in the pool. Raises PoolBusyError when the queue is full."""
+        result, _ = await self._submit(fn, args, None)
+        return result
+
+    async def run_profiled(self, fn: Callable[..., Any], *args: Any, profiler: Optional[str] = None) -> Tuple[Any, Optional[str]]:
+        """Like run, but profiles the call with profiler (see core.metrics) and returns (result, profile_path)."""
+        return await self._submit(fn, args, profiler)
@@ -2,21 +2,56 @@ import os
 import shutil
 import uuid
 import json
+import asyncio
+import time
+from contextlib import asynccontextmanager
 from base64 import urlsafe_b64encode, urlsafe_b64decode
-from typing import Dict, Any, Literal, List 
+from functools import partial
+from urllib.parse import quote
+from typing import Dict, Any, Literal, List, Optional
 
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, BackgroundTasks, Header, Request
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
 from dotenv import load_dotenv
 load_dotenv()
 
-from core.engine import process_document_llm, process_document_classic, unredact_document
+from core.engine import process_document_llm, process_document_classic, unredact_document, reredact_document, \
+    process_document_llm_levels, process_document_classic_levels, CLASSIC_SEVERITY_MAPPING, LLM_SEVERITY_MAPPING, LLM_MODE
 from core.security import generate_key, decrypt_text
+from core.metadata import METADATA_VERSION, SUPPORTED_METADATA_VERSIONS
+from core.documents import Document, SPILL_THRESHOLD_BYTES
+from core.workers import DocumentProcessPool, PoolBusyError
+from core.jobs import make_job_store, ProgressRelay, run_job, is_stale, expire_jobs, JOB_SWEEP_INTERVAL_SECONDS
+from core.batch import BatchWriter, BatchItem, BatchTooLargeError, ZipStream, BATCH_CONCURRENCY
+from core.metrics import PROFILE_REQUESTS, PROFILERS, observe, render_metrics
 
-app = FastAPI(title="Dual-Engine Document Redaction Service")
+process_pool = DocumentProcessPool()
+job_store = make_job_store()
+progress_relay = ProgressRelay(job_store)
+running_jobs = set()
+
+async def sweep_expired_jobs():
+    while True:
+        try:
+            await asyncio.to_thread(expire_jobs, job_store)
+        except Exception as e:
+            print(f"Error expiring jobs: {e}")
+        await asyncio.sleep(JOB_SWEEP_INTERVAL_SECONDS)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    process_pool.start()
+    progress_relay.start()
+    sweeper = asyncio.create_task(sweep_expired_jobs())
+    yield
+    sweeper.cancel()
+    progress_relay.shutdown()
+    process_pool.shutdown()
+
+app = FastAPI(title="Dual-Engine Document Redaction Service", lifespan=lifespan)
 
 origins = ["*"]
 app.add_middleware(
@@ -25,10 +60,26 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Profile-Path"],
 )
 
+@app.middleware("http")
+async def observe_request_duration(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template, not the raw path, so job ids do not each get a series.
+        route = request.scope.get("route")
+        observe("http_duration", time.perf_counter() - start, method=request.method,
+                route=route.path if route else "unmatched", status=str(status))
+
 TEMP_UPLOADS_DIR = "temp_uploads"
 os.makedirs(TEMP_UPLOADS_DIR, exist_ok=True)
+STREAM_CHUNK_SIZE = 1024 * 1024
 
 class DecryptionRequest(BaseModel):
     document_id: str
@@ -51,40 +102,182 @@ def cleanup_files(files: list):
             except OSError as e:
                 print(f"Error cleaning up file {file_path}: {e}")
 
+def spilled_files(*documents: Document) -> List[str]:
+    return [document.path for document in documents if document.path is not None]
+
+def save_upload(file: UploadFile, path: str):
+    with open(path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+
+async def read_upload(file: UploadFile) -> Document:
+    """
+    Reads uploads up to SPILL_THRESHOLD_BYTES into memory, as the engines would keep them,
+    and copies larger ones to TEMP_UPLOADS_DIR. Starlette has already spooled anything over
+    1MB to a temporary file, so only the uploads being processed are held in memory.
+    """
+    if file.size is not None and file.size <= SPILL_THRESHOLD_BYTES:
+        return Document(file.filename, data=await file.read())
+    input_path = os.path.join(TEMP_UPLOADS_DIR, f"{uuid.uuid4()}_{file.filename}")
+    await asyncio.to_thread(save_upload, file, input_path)
+    return Document(file.filename, path=input_path)
+
+def attachment_headers(filename: str) -> Dict[str, str]:
+    """Content-Disposition for filename, as FileResponse would set it."""
+    quoted = quote(filename)
+    if quoted != filename:
+        return {"Content-Disposition": f"attachment; filename*=utf-8''{quoted}"}
+    return {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+def check_metadata_version(metadata_version: int):
+    if metadata_version not in SUPPORTED_METADATA_VERSIONS:
+        raise HTTPException(status_code=400, detail=f"Unsupported metadata version: {metadata_version}")
+
+def process_function(engine: str, metadata_version: int, llm_mode: str, levels: bool = False):
+    """The engine's processing function, with the request's options bound."""
+    if engine == 'llm':
+        return partial(process_document_llm_levels if levels else process_document_llm, metadata_version=metadata_version, mode=llm_mode)
+    return partial(process_document_classic_levels if levels else process_document_classic, metadata_version=metadata_version)
+
+def requested_profiler(x_profile: Optional[str]) -> Optional[str]:
+    if not x_profile or not PROFILE_REQUESTS:
+        return None
+    if x_profile not in PROFILERS:
+        raise HTTPException(status_code=400, detail=f"Unknown profiler: {x_profile}. Use one of {', '.join(PROFILERS)}.")
+    return x_profile
+
+def profile_headers(profile_path: Optional[str]) -> Dict[str, str]:
+    return {"X-Profile-Path": profile_path} if profile_path else {}
+
+def multipart_response(metadata: Dict[str, Any], document: Document, content_type: str, filename: str,
+                       headers: Optional[Dict[str, str]] = None) -> StreamingResponse:
+    """
+    Streams a multipart/mixed response: a small JSON part with the key and
+    metadata, then the redacted file, read from disk in STREAM_CHUNK_SIZE chunks if spilled.
+    """
+    boundary = uuid.uuid4().hex
+
+    def body():
+        yield (f"--{boundary}\r\nContent-Type: application/json\r\n"
+               f"Content-Disposition: form-data; name=\"metadata\"\r\n\r\n").encode('utf-8')
+        yield json.dumps(metadata).encode('utf-8')
+        yield (f"\r\n--{boundary}\r\nContent-Type: {content_type or 'application/octet-stream'}\r\n"
+               f"Content-Disposition: form-data; name=\"redactedFile\"; filename=\"{filename}\"\r\n\r\n").encode('utf-8')
+        if document.data is not None:
+            yield document.data
+        else:
+            with open(document.path, "rb") as f:
+                while chunk := f.read(STREAM_CHUNK_SIZE):
+                    yield chunk
+        yield f"\r\n--{boundary}--\r\n".encode('utf-8')
+
+    return StreamingResponse(body(), media_type=f"multipart/mixed; boundary={boundary}", headers=headers)
+
 @app.post("/process/", summary="Process a document with chosen engine", tags=["Processing"])
 async def process_endpoint(
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     severity: int = Form(...),
-    engine: Literal['classic', 'llm'] = Form(...)
+    engine: Literal['classic', 'llm'] = Form(...),
+    response_format: Literal['json', 'multipart'] = Form('json'),
+    metadata_version: int = Form(METADATA_VERSION),
+    llm_mode: Literal['vision', 'text'] = Form(LLM_MODE),
+    x_profile: Optional[str] = Header(None)
 ):
-    print("DEBUG: Request reached /process/ endpoint") 
-    unique_filename = f"{uuid.uuid4()}_{file.filename}"
-    input_path = os.path.join(TEMP_UPLOADS_DIR, unique_filename)
-    with open(input_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    """
+    response_format='json' returns the redacted file base64-encoded inside the JSON body.
+    response_format='multipart' streams a multipart/mixed body instead: a JSON part with
+    decryptionKey, encryptedMetadata and contentType, followed by the raw redacted file.
+    metadata_version=2 returns encryptedMetadata as one compact encrypted blob per page.
+    llm_mode='text' sends the LLM the words of pages with a text layer instead of page images.
+    With PROFILE_REQUESTS=1, an X-Profile header of "cprofile" or "pyinstrument" profiles
+    the processing and returns the profile's path on the server in X-Profile-Path.
+    """
+    check_metadata_version(metadata_version)
+    profiler = requested_profiler(x_profile)
+    document = await read_upload(file)
     
     key = generate_key()
     
     try:
-        if engine == 'llm':
-            redacted_file_path, encrypted_metadata = process_document_llm(input_path, severity, key)
-        else:
-            redacted_file_path, encrypted_metadata = process_document_classic(input_path, severity, key)
-        
-        with open(redacted_file_path, "rb") as f:
-            redacted_file_bytes = f.read()
-            
-        background_tasks.add_task(cleanup_files, [input_path, redacted_file_path])
+        process_fn = process_function(engine, metadata_version, llm_mode)
+        (redacted_document, encrypted_metadata), profile_path = await process_pool.run_profiled(
+            process_fn, document, severity, key, profiler=profiler)
+        background_tasks.add_task(cleanup_files, spilled_files(document, redacted_document))
+
+        if response_format == 'multipart':
+            return multipart_response({
+                "decryptionKey": urlsafe_b64encode(key).decode('utf-8'),
+                "encryptedMetadata": encrypted_metadata,
+                "contentType": file.content_type,
+            }, redacted_document, file.content_type, f"redacted_{file.filename}", profile_headers(profile_path))
+
+        start = time.perf_counter()
+        redacted_file_bytes = redacted_document.read()
         
-        return JSONResponse(content={
+        response = JSONResponse(content={
             "decryptionKey": urlsafe_b64encode(key).decode('utf-8'),
             "encryptedMetadata": encrypted_metadata,
             "redactedFile": urlsafe_b64encode(redacted_file_bytes).decode('utf-8'),
             "contentType": file.content_type,
-        })
+        }, headers=profile_headers(profile_path))
+        observe("stage_duration", time.perf_counter() - start, engine=engine, operation="process", stage="encode_response")
+        return response
+    except PoolBusyError:
+        background_tasks.add_task(cleanup_files, spilled_files(document))
+        raise HTTPException(status_code=503, detail="Server is busy, please retry later.")
     except Exception as e:
-        background_tasks.add_task(cleanup_files, [input_path])
+        background_tasks.add_task(cleanup_files, spilled_files(document))
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+
+
+@app.post("/process-levels/", summary="Process a document at several severities at once", tags=["Processing"])
+async def process_levels_endpoint(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    severities: List[int] = Form(...),
+    engine: Literal['classic', 'llm'] = Form(...),
+    metadata_version: int = Form(METADATA_VERSION),
+    llm_mode: Literal['vision', 'text'] = Form(LLM_MODE),
+    x_profile: Optional[str] = Header(None)
+):
+    """
+    Extracts and detects once, then redacts the document at every requested severity
+    (send the severities field once per level). Returns contentType and, per level in
+    ascending order, severity, decryptionKey, encryptedMetadata and the base64 redactedFile.
+    Every level has its own key, so sharing one level does not expose another.
+    """
+    check_metadata_version(metadata_version)
+    profiler = requested_profiler(x_profile)
+    severity_mapping = LLM_SEVERITY_MAPPING if engine == 'llm' else CLASSIC_SEVERITY_MAPPING
+    unknown = [severity for severity in severities if severity not in severity_mapping]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown severities: {unknown}. Use any of {sorted(severity_mapping)}.")
+    keys = {severity: generate_key() for severity in sorted(set(severities))}
+    document = await read_upload(file)
+
+    try:
+        process_fn = process_function(engine, metadata_version, llm_mode, levels=True)
+        results, profile_path = await process_pool.run_profiled(process_fn, document, keys, profiler=profiler)
+        background_tasks.add_task(cleanup_files, spilled_files(document, *(output for output, _ in results.values())))
+
+        start = time.perf_counter()
+        levels = []
+        for severity, key in keys.items():
+            redacted_document, encrypted_metadata = results[severity]
+            levels.append({
+                "severity": severity,
+                "decryptionKey": urlsafe_b64encode(key).decode('utf-8'),
+                "encryptedMetadata": encrypted_metadata,
+                "redactedFile": urlsafe_b64encode(redacted_document.read()).decode('utf-8'),
+            })
+        response = JSONResponse(content={"contentType": file.content_type, "levels": levels}, headers=profile_headers(profile_path))
+        observe("stage_duration", time.perf_counter() - start, engine=engine, operation="process", stage="encode_response")
+        return response
+    except PoolBusyError:
+        background_tasks.add_task(cleanup_files, spilled_files(document))
+        raise HTTPException(status_code=503, detail="Server is busy, please retry later.")
+    except Exception as e:
+        background_tasks.add_task(cleanup_files, spilled_files(document))
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 
@@ -94,28 +287,318 @@ async def unredact_endpoint(
     file: UploadFile = File(...),
     decryption_key: str = Form(...),
     encrypted_metadata_json: str = Form(...),
-    password: str = Form(None)
-) -> FileResponse:
+    password: str = Form(None),
+    x_profile: Optional[str] = Header(None)
+) -> Response:
+    profiler = requested_profiler(x_profile)
     encrypted_metadata = json.loads(encrypted_metadata_json)
     try:
         key = urlsafe_b64decode(decryption_key)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid key format.")
 
-    temp_redacted_path = os.path.join(TEMP_UPLOADS_DIR, f"{uuid.uuid4()}_{file.filename}")
-    with open(temp_redacted_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    document = await read_upload(file)
 
     try:
-        restored_file_path = unredact_document(temp_redacted_path, key, encrypted_metadata, password)
+        restored_document, profile_path = await process_pool.run_profiled(
+            unredact_document, document, key, encrypted_metadata, password, profiler=profiler)
         
-        background_tasks.add_task(cleanup_files, [temp_redacted_path, restored_file_path])
+        background_tasks.add_task(cleanup_files, spilled_files(document, restored_document))
         
+        filename = f"restored_{file.filename.replace('redacted_', '')}"
+        if restored_document.data is not None:
+            return Response(
+                content=restored_document.data,
+                media_type=file.content_type,
+                headers={**attachment_headers(filename), **profile_headers(profile_path)}
+            )
         return FileResponse(
-            path=restored_file_path,
+            path=restored_document.path,
             media_type=file.content_type,
-            filename=f"restored_{file.filename.replace('redacted_', '')}"
+            filename=filename,
+            headers=profile_headers(profile_path)
         )
+    except PoolBusyError:
+        background_tasks.add_task(cleanup_files, spilled_files(document))
+        raise HTTPException(status_code=503, detail="Server is busy, please retry later.")
     except Exception as e:
-        background_tasks.add_task(cleanup_files, [temp_redacted_path])
-        raise HTTPException(status_code=500, detail=f"An error during un-redaction: {str(e)}")
\ No newline at end of file
+        background_tasks.add_task(cleanup_files, spilled_files(document))
+        raise HTTPException(status_code=500, detail=f"An error during un-redaction: {str(e)}")
+
+
+@app.post("/reredact/", summary="Add redactions to an already redacted PDF", tags=["Processing"])
+async def reredact_endpoint(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    decryption_key: str = Form(...),
+    encrypted_metadata_json: str = Form(...),
+    boxes_json: str = Form(None),
+    severity: Optional[int] = Form(None),
+    engine: Literal['classic', 'llm'] = Form('classic'),
+    response_format: Literal['json', 'multipart'] = Form('json'),
+    llm_mode: Literal['vision', 'text'] = Form(LLM_MODE),
+    x_profile: Optional[str] = Header(None)
+):
+    """
+    Redacts more of a PDF returned by /process/, given its decryptionKey and encryptedMetadata.
+    boxes_json is a JSON list of {"page", "bbox": [x0, y0, x1, y1]} in PDF points to redact;
+    severity redacts whatever engine detects at that severity in the text still visible.
+    Only pages with new redactions are redacted again. The response is that of /process/,
+    with the same decryptionKey and the new items merged into encryptedMetadata.
+    """
+    profiler = requested_profiler(x_profile)
+    try:
+        key = urlsafe_b64decode(decryption_key)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid key format.")
+    try:
+        encrypted_metadata = json.loads(encrypted_metadata_json)
+        boxes = [(int(box["page"]), [float(coord) for coord in box["bbox"]]) for box in json.loads(boxes_json or "[]")]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid encrypted_metadata_json or boxes_json.")
+    if any(len(bbox) != 4 for _, bbox in boxes):
+        raise HTTPException(status_code=400, detail="Every bbox must be [x0, y0, x1, y1].")
+    if not boxes and severity is None:
+        raise HTTPException(status_code=400, detail="Send boxes_json, a severity, or both.")
+    severity_mapping = LLM_SEVERITY_MAPPING if engine == 'llm' else CLASSIC_SEVERITY_MAPPING
+    if severity is not None and severity not in severity_mapping:
+        raise HTTPException(status_code=400, detail=f"Unknown severity: {severity}. Use one of {sorted(severity_mapping)}.")
+
+    document = await read_upload(file)
+
+    try:
+        reredact_fn = partial(reredact_document, engine=engine, mode=llm_mode)
+        (redacted_document, merged_metadata), profile_path = await process_pool.run_profiled(
+            reredact_fn, document, key, encrypted_metadata, boxes, severity, profiler=profiler)
+        background_tasks.add_task(cleanup_files, spilled_files(document, redacted_document))
+
+        if response_format == 'multipart':
+            return multipart_response({
+                "decryptionKey": decryption_key,
+                "encryptedMetadata": merged_metadata,
+                "contentType": file.content_type,
+            }, redacted_document, file.content_type, file.filename, profile_headers(profile_path))
+
+        return JSONResponse(content={
+            "decryptionKey": decryption_key,
+            "encryptedMetadata": merged_metadata,
+            "redactedFile": urlsafe_b64encode(redacted_document.read()).decode('utf-8'),
+            "contentType": file.content_type,
+        }, headers=profile_headers(profile_path))
+    except PoolBusyError:
+        background_tasks.add_task(cleanup_files, spilled_files(document))
+        raise HTTPException(status_code=503, detail="Server is busy, please retry later.")
+    except ValueError as e:
+        background_tasks.add_task(cleanup_files, spilled_files(document))
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        background_tasks.add_task(cleanup_files, spilled_files(document))
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+
+
+async def process_batch_item(item: BatchItem, process_fn, severity: int, semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+    """Processes one file of a batch; failures are returned as a manifest entry instead of raised."""
+    key = generate_key()
+    async with semaphore:
+        try:
+            redacted_document, encrypted_metadata = await process_pool.run(process_fn, item.input_path, severity, key)
+        except PoolBusyError:
+            return {"filename": item.filename, "status": "failed", "error": "Server is busy, please retry later."}
+        except Exception as e:
+            return {"filename": item.filename, "status": "failed", "error": str(e)}
+    return {
+        "filename": item.filename,
+        "status": "done",
+        "decryptionKey": urlsafe_b64encode(key).decode('utf-8'),
+        "encryptedMetadata": encrypted_metadata,
+        "contentType": item.content_type,
+        "redactedDocument": redacted_document,
+    }
+
+async def batch_zip_body(batch: BatchWriter, process_fn, severity: int):
+    """
+    Processes the files of a batch BATCH_CONCURRENCY at a time and streams a ZIP back:
+    each redacted file is sent as soon as it is ready, followed by manifest.json
+    with every file's key and metadata (or error) in upload order.
+    """
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    tasks = [asyncio.create_task(process_batch_item(item, process_fn, severity, semaphore)) for item in batch.items]
+    index_of = {task: index for index, task in enumerate(tasks)}
+    manifest: List[Dict[str, Any]] = [{} for _ in tasks]
+    archive = ZipStream()
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                entry = task.result()
+                redacted_document = entry.pop("redactedDocument", None)
+                if redacted_document:
+                    entry["redactedFile"] = archive.unique_name(f"redacted_{entry['filename']}")
+                    if redacted_document.data is not None:
+                        await asyncio.to_thread(archive.add_bytes, entry["redactedFile"], redacted_document.data)
+                    else:
+                        await asyncio.to_thread(archive.add_file, redacted_document.path, entry["redactedFile"])
+                        if redacted_document.path != batch.items[index_of[task]].input_path:
+                            cleanup_files([redacted_document.path])
+                manifest[index_of[task]] = entry
+            yield archive.drain()
+        archive.add_bytes("manifest.json", json.dumps({"files": manifest}).encode('utf-8'))
+        archive.close()
+        yield archive.drain()
+    finally:
+        for task in tasks:
+            task.cancel()
+        batch.cleanup()
+
+
+@app.post("/process-batch/", summary="Process many documents and download them as a ZIP", tags=["Processing"])
+async def process_batch_endpoint(
+    files: List[UploadFile] = File(...),
+    severity: int = Form(...),
+    engine: Literal['classic', 'llm'] = Form(...),
+    metadata_version: int = Form(METADATA_VERSION),
+    llm_mode: Literal['vision', 'text'] = Form(LLM_MODE)
+):
+    """
+    Accepts several files and/or ZIP archives of files and streams back a ZIP with
+    a redacted_<name> entry per processed file and a manifest.json listing, per file,
+    its status, decryptionKey, encryptedMetadata, contentType and redactedFile entry,
+    or the error that stopped it. A failing file does not fail the batch.
+    """
+    check_metadata_version(metadata_version)
+    batch = BatchWriter(TEMP_UPLOADS_DIR)
+    try:
+        for file in files:
+            await asyncio.to_thread(batch.add_upload, file.filename, file.file, file.content_type)
+    except BatchTooLargeError as e:
+        batch.cleanup()
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        batch.cleanup()
+        raise HTTPException(status_code=400, detail=str(e))
+    if not batch.items:
+        raise HTTPException(status_code=400, detail="The batch contains no files.")
+
+    process_fn = process_function(engine, metadata_version, llm_mode)
+    return StreamingResponse(
+        batch_zip_body(batch, process_fn, severity),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="redacted_batch.zip"'},
+    )
+
+
+async def finish_job(job_id: str, future: "asyncio.Future", input_path: str, content_type: str):
+    try:
+        redacted_file_path, encrypted_metadata = await future
+    except Exception as e:
+        await asyncio.to_thread(job_store.update, job_id, status="failed", stage="failed", error=str(e))
+        cleanup_files([input_path])
+        return
+    result = {
+        "redactedFilePath": redacted_file_path,
+        "encryptedMetadata": encrypted_metadata,
+        "contentType": content_type,
+    }
+    await asyncio.to_thread(job_store.update, job_id, status="done", stage="done", result=result)
+    if redacted_file_path != input_path:
+        cleanup_files([input_path])
+
+
+@app.post("/jobs", status_code=202, summary="Queue a document for processing", tags=["Jobs"])
+async def create_job_endpoint(
+    file: UploadFile = File(...),
+    severity: int = Form(...),
+    engine: Literal['classic', 'llm'] = Form(...),
+    metadata_version: int = Form(METADATA_VERSION),
+    llm_mode: Literal['vision', 'text'] = Form(LLM_MODE)
+):
+    """
+    Queues a document and returns its jobId and decryptionKey. The key is not stored
+    with the job, so keep it: the result of the job can only be restored with it.
+    """
+    check_metadata_version(metadata_version)
+    job_id = str(uuid.uuid4())
+    input_path = os.path.join(TEMP_UPLOADS_DIR, f"{job_id}_{file.filename}")
+    await asyncio.to_thread(save_upload, file, input_path)
+
+    key = generate_key()
+    await asyncio.to_thread(job_store.create, job_id, {"engine": engine, "severity": severity, "filename": file.filename})
+    try:
+        future = process_pool.submit(run_job, job_id, engine, input_path, severity, key, progress_relay.queue, metadata_version, llm_mode)
+    except PoolBusyError:
+        await asyncio.to_thread(job_store.delete, job_id)
+        cleanup_files([input_path])
+        raise HTTPException(status_code=503, detail="Server is busy, please retry later.")
+
+    task = asyncio.create_task(finish_job(job_id, future, input_path, file.content_type))
+    running_jobs.add(task)
+    task.add_done_callback(running_jobs.discard)
+    return {"jobId": job_id, "status": "queued", "decryptionKey": urlsafe_b64encode(key).decode('utf-8')}
+
+
+def read_base64(path: str) -> str:
+    with open(path, "rb") as f:
+        return urlsafe_b64encode(f.read()).decode('utf-8')
+
+
+def get_job_or_404(job_id: str) -> Dict[str, Any]:
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    if is_stale(job):
+        job.update(status="failed", error="Job stopped reporting progress.")
+    return job
+
+
+@app.get("/jobs/{job_id}", summary="Get job status and progress", tags=["Jobs"])
+async def job_status_endpoint(job_id: str):
+    job = await asyncio.to_thread(get_job_or_404, job_id)
+    return {
+        "jobId": job["id"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "pagesDone": job["pages_done"],
+        "pagesTotal": job["pages_total"],
+        "error": job["error"],
+    }
+
+
+@app.get("/jobs/{job_id}/result", summary="Get the result of a finished job", tags=["Jobs"])
+async def job_result_endpoint(job_id: str, response_format: Literal['json', 'multipart'] = 'json'):
+    job = await asyncio.to_thread(get_job_or_404, job_id)
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=f"An error occurred: {job['error']}")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}.")
+
+    result = job["result"]
+    if response_format == 'multipart':
+        return multipart_response({
+            "encryptedMetadata": result["encryptedMetadata"],
+            "contentType": result["contentType"],
+        }, Document(job['params']['filename'], path=result["redactedFilePath"]), result["contentType"], f"redacted_{job['params']['filename']}")
+
+    redacted_file = await asyncio.to_thread(read_base64, result["redactedFilePath"])
+    return JSONResponse(content={
+        "encryptedMetadata": result["encryptedMetadata"],
+        "redactedFile": redacted_file,
+        "contentType": result["contentType"],
+    })
+
+
+@app.delete("/jobs/{job_id}", summary="Delete a job and its files", tags=["Jobs"])
+async def delete_job_endpoint(job_id: str):
+    job = await asyncio.to_thread(get_job_or_404, job_id)
+    if job["status"] in ("queued", "running"):
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}.")
+    if job["result"]:
+        cleanup_files([job["result"]["redactedFilePath"]])
+    await asyncio.to_thread(job_store.delete, job_id)
+    return {"jobId": job_id, "status": "deleted"}
+
+@app.get("/metrics", summary="Prometheus metrics", tags=["Monitoring"])
+async def metrics_endpoint():
+    """Stage timings, document sizes and request latencies, in the Prometheus text format."""
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)